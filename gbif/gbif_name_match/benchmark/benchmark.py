@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the GBIF name matching and synonym verification against a local
+stand-in of the GBIF API, using synthetic checklists
+
+created within the scope of Lifewatch - INBO
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "..", "verify_synonyms"))
+
+from mock_gbif_api import match_message, species_message
+
+KINGDOMS = ["Animalia", "Plantae", "Fungi", "Chromista"]
+SYLLABLES = ["a", "ae", "an", "ba", "ca", "ce", "da", "di", "el", "er", "fa",
+             "ga", "hi", "io", "la", "li", "ma", "mo", "na", "ne", "or", "pa",
+             "pi", "ra", "ri", "sa", "su", "ta", "ti", "ul", "um", "us", "va"]
+
+
+def _random_word(rng, min_syllables=2, max_syllables=5):
+    return "".join(rng.choice(SYLLABLES,
+                              rng.integers(min_syllables, max_syllables + 1)))
+
+
+def make_checklist(size, unique_ratio=0.05, seed=42):
+    """synthetic checklist of size rows with a realistic duplication: the
+    names are drawn from a vocabulary of size * unique_ratio names with a
+    Zipf-like frequency distribution
+
+    Returns
+    -------
+    checklist : pd.DataFrame
+        columns scientificName and kingdom
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(10, int(size * unique_ratio))
+    genera = [_random_word(rng).capitalize()
+              for _ in range(max(1, n_unique // 20))]
+    vocabulary = ["".join([rng.choice(genera), " ", _random_word(rng)])
+                  for _ in range(n_unique)]
+    kingdoms = rng.choice(KINGDOMS, n_unique, p=[0.5, 0.35, 0.1, 0.05])
+
+    frequency = 1. / np.arange(1, n_unique + 1) ** 1.1
+    picks = rng.choice(n_unique, size, p=frequency / frequency.sum())
+    return pd.DataFrame({"scientificName": np.array(vocabulary)[picks],
+                         "kingdom": kingdoms[picks]})
+
+
+def make_matched_checklist(checklist, synonym_ratio=0.1):
+    """add the gbifapi_* columns to the checklist as the mock API would"""
+    matched = {}
+    for name, kingdom in set(zip(checklist["scientificName"],
+                                 checklist["kingdom"])):
+        message = match_message(name, kingdom, synonym_ratio)
+        if "usageKey" in message:
+            if message["status"] == "SYNONYM":
+                accepted_key = species_message(message["usageKey"])[
+                    "acceptedKey"]
+            else:
+                accepted_key = message["usageKey"]
+            matched[(name, kingdom)] = (str(message["usageKey"]),
+                                        str(accepted_key),
+                                        message["status"])
+        else:
+            matched[(name, kingdom)] = (None, None, None)
+    columns = list(zip(*[matched[(name, kingdom)] for name, kingdom in
+                         zip(checklist["scientificName"],
+                             checklist["kingdom"])]))
+    checklist = checklist.copy()
+    checklist["gbifapi_usageKey"] = columns[0]
+    checklist["gbifapi_acceptedKey"] = columns[1]
+    checklist["gbifapi_status"] = columns[2]
+    return checklist
+
+
+def make_synonym_list(matched_checklist, fraction=0.5, seed=42):
+    """synonym list with a known status for a fraction of the synonyms of
+    the matched checklist
+    """
+    synonyms = matched_checklist.loc[
+        matched_checklist["gbifapi_status"] == "SYNONYM",
+        ["gbifapi_usageKey", "gbifapi_acceptedKey"]].drop_duplicates()
+    synonyms = synonyms.sample(frac=fraction, random_state=seed)
+    rng = np.random.default_rng(seed)
+    synonyms["status"] = rng.choice(["ok", "verify", "wrong"], len(synonyms),
+                                    p=[0.8, 0.15, 0.05])
+    return synonyms
+
+
+def prepare_data(size, data_dir, unique_ratio=0.05, synonym_ratio=0.1):
+    """write (or reuse) the synthetic files of a benchmark size
+
+    Returns
+    -------
+    files : dict
+        checklist, matched and synonyms file names
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    files = {item: os.path.join(data_dir, "".join([
+                 item, "_", str(size), "_", str(unique_ratio), "_",
+                 str(synonym_ratio), ".tsv" if item == "synonyms" else ".csv"]))
+             for item in ["checklist", "matched", "synonyms"]}
+    if not all(os.path.exists(filename) for filename in files.values()):
+        checklist = make_checklist(size, unique_ratio)
+        checklist.to_csv(files["checklist"], index=False)
+        matched = make_matched_checklist(checklist, synonym_ratio)
+        matched.to_csv(files["matched"], index=False)
+        make_synonym_list(matched).to_csv(files["synonyms"], sep="\t",
+                                          index=False)
+    return files
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _api_stats(api_url):
+    """request counts of the mock API"""
+    stats_url = api_url.replace("/v1/", "/stats")
+    with urllib.request.urlopen(stats_url) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def start_mock_api(latency=0., error_rate=0., synonym_ratio=0.1):
+    """run the mock API in a separate process (not competing with the
+    benchmarked code for the GIL)
+
+    Returns
+    -------
+    process : subprocess.Popen
+        the mock API process, to terminate when done
+    api_url : str
+        base URL of the mock API
+    """
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARK_DIR, "mock_gbif_api.py"),
+         "--port", str(port), "--latency", str(latency),
+         "--error_rate", str(error_rate),
+         "--synonym_ratio", str(synonym_ratio)],
+        stdout=subprocess.DEVNULL)
+    api_url = "http://127.0.0.1:{}/v1/".format(port)
+    for _ in range(100):
+        try:
+            _api_stats(api_url)
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        process.terminate()
+        raise Exception("Mock GBIF API did not start")
+    return process, api_url
+
+
+def _run_case(case, files, options, results):
+    """run a single benchmark case (in a separate process, to measure its
+    peak memory)
+    """
+    sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    if case == "match":
+        import gbif_species_name_match as gsnm
+        gsnm.GBIF_API_URL = options["api_url"]
+        output = files["checklist"].replace(".csv", "_out.csv")
+        gsnm.extract_species_information(files["checklist"], output,
+                                         workers=options["workers"],
+                                         chunksize=options["chunksize"])
+    elif case == "verify":
+        from verify_synonyms import verify_synonym
+        output = files["matched"].replace(".csv", "_out.csv")
+        verify_synonym(files["matched"], output, files["synonyms"])
+    else:
+        raise Exception("".join(["Unknown benchmark case ", case]))
+    elapsed = time.perf_counter() - start
+    os.remove(output)
+
+    if resource is not None:
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak_memory /= 1024 ** 2 if sys.platform == "darwin" else 1024
+    else:
+        peak_memory = None
+    results.put({"elapsed": elapsed, "peak_memory_mb": peak_memory})
+
+
+def run_benchmark(sizes=(1000, 100000, 1000000), cases=("match", "verify"),
+                  workers=8, chunksize=None, latency=0.005, error_rate=0.,
+                  synonym_ratio=0.1, unique_ratio=0.05,
+                  data_dir="benchmark_data"):
+    """run the benchmark cases for each of the checklist sizes
+
+    Returns
+    -------
+    report : pd.DataFrame
+        per case and size the rows, seconds, rows per second, peak memory and
+        number of API calls (match, species and errors)
+    """
+    process, api_url = start_mock_api(latency, error_rate, synonym_ratio)
+    context = multiprocessing.get_context("spawn")
+    report = []
+    try:
+        for size in sizes:
+            files = prepare_data(size, data_dir, unique_ratio, synonym_ratio)
+            for case in cases:
+                stats_before = _api_stats(api_url)
+                results = context.Queue()
+                options = {"api_url": api_url, "workers": workers,
+                           "chunksize": chunksize}
+                worker = context.Process(target=_run_case,
+                                         args=(case, files, options, results))
+                worker.start()
+                worker.join()
+                if worker.exitcode != 0:
+                    raise Exception("".join(["Benchmark case ", case,
+                                             " failed for size ", str(size)]))
+                result = results.get()
+                stats_after = _api_stats(api_url)
+
+                row = {"case": case, "rows": size,
+                       "seconds": round(result["elapsed"], 3),
+                       "rows_per_second": round(size / result["elapsed"], 1),
+                       "peak_memory_mb": result["peak_memory_mb"]}
+                for item in ["match", "species", "errors"]:
+                    row["".join(["api_", item])] = \
+                        stats_after[item] - stats_before[item]
+                print(json.dumps(row))
+                report.append(row)
+    finally:
+        process.terminate()
+        process.wait()
+    return pd.DataFrame(report)
+
+
+def main(argv=None):
+    """
+    Run the benchmark and report the rows per second, peak memory and number
+    of API calls
+    """
+    parser = argparse.ArgumentParser(description="""Benchmark the GBIF name
+        matching and synonym verification on synthetic checklists, using a
+        local stand-in of the GBIF API.
+        """)
+
+    parser.add_argument('--sizes', type=int, nargs='+', action='store',
+                        default=[1000, 100000, 1000000],
+                        help='number of rows of the synthetic checklists (default: 1000 100000 1000000)')
+
+    parser.add_argument('--cases', type=str, nargs='+', action='store',
+                        choices=['match', 'verify'],
+                        default=['match', 'verify'],
+                        help='benchmark cases to run (default: match verify)')
+
+    parser.add_argument('--workers', type=int, action='store', default=8,
+                        help='number of concurrent requests of the name matching (default: 8)')
+
+    parser.add_argument('--chunksize', type=int, action='store',
+                        default=None,
+                        help='process the checklists in chunks of chunksize rows (default: None)')
+
+    parser.add_argument('--latency', type=float, action='store',
+                        default=0.005,
+                        help='mean response time of the mock API in seconds (default: 0.005)')
+
+    parser.add_argument('--error_rate', type=float, action='store',
+                        default=0.,
+                        help='fraction of the mock API requests answered with a 503 error (default: 0)')
+
+    parser.add_argument('--synonym_ratio', type=float, action='store',
+                        default=0.1,
+                        help='fraction of the names matched as a SYNONYM (default: 0.1)')
+
+    parser.add_argument('--unique_ratio', type=float, action='store',
+                        default=0.05,
+                        help='number of distinct names relative to the number of rows (default: 0.05)')
+
+    parser.add_argument('--data_dir', type=str, action='store',
+                        default='benchmark_data',
+                        help='directory to store the synthetic checklists (default: benchmark_data)')
+
+    parser.add_argument('--output', type=str, action='store', default=None,
+                        help='csv file to write the benchmark report to (default: None)')
+
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.cases, args.workers,
+                           args.chunksize, args.latency, args.error_rate,
+                           args.synonym_ratio, args.unique_ratio,
+                           args.data_dir)
+    print(report.to_string(index=False))
+    if args.output:
+        report.to_csv(args.output, index=False)
+
+if __name__ == "__main__":
+    sys.exit(main())
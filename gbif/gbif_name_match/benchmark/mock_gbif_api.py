@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in of the GBIF species API for benchmarking, with a configurable
+latency, error rate and ratio of synonyms
+
+created within the scope of Lifewatch - INBO
+"""
+
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# usageKeys of the accepted names are offset from the synonym usageKeys
+ACCEPTED_KEY_OFFSET = 10000000
+
+
+def name_hash(name):
+    """stable hash of a name, in the range [0, 1)"""
+    return zlib.crc32(name.lower().encode("utf-8")) / 2 ** 32
+
+
+def name_usage_key(name):
+    """usageKey of a name as provided by the mock API"""
+    return zlib.crc32(name.lower().encode("utf-8")) % ACCEPTED_KEY_OFFSET + 1
+
+
+def match_message(name, kingdom=None, synonym_ratio=0.1, none_ratio=0.05):
+    """deterministic response of the mock match API for a name; the hash of
+    the name decides on a SYNONYM (synonym_ratio) or no match (none_ratio)
+    """
+    fraction = name_hash(name)
+    if fraction < none_ratio:
+        return {"confidence": 100, "matchType": "NONE",
+                "note": "No match because of too little confidence",
+                "synonym": False}
+    usage_key = name_usage_key(name)
+    message = {"usageKey": usage_key,
+               "scientificName": name + " Author, 1900",
+               "canonicalName": name,
+               "rank": "SPECIES",
+               "status": "ACCEPTED",
+               "confidence": 98,
+               "matchType": "EXACT",
+               "kingdom": kingdom or "Animalia",
+               "synonym": False}
+    if fraction < none_ratio + synonym_ratio:
+        message["status"] = "SYNONYM"
+        message["synonym"] = True
+        message["acceptedUsageKey"] = usage_key + ACCEPTED_KEY_OFFSET
+    return message
+
+
+def species_message(usage_key):
+    """response of the mock species/{key} API"""
+    return {"key": usage_key,
+            "acceptedKey": usage_key + ACCEPTED_KEY_OFFSET,
+            "accepted": "".join(["Accepted name ", str(usage_key)]),
+            "taxonomicStatus": "SYNONYM"}
+
+
+class MockGbifApi(ThreadingHTTPServer):
+    """
+    HTTP server answering the species/match and species/{key} requests of
+    the GBIF API with synthetic (but deterministic) responses.
+
+    Example
+    -------
+    server = MockGbifApi(("127.0.0.1", 0), latency=0.05, error_rate=0.01)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = server.api_url
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0., error_rate=0.,
+                 synonym_ratio=0.1, none_ratio=0.05):
+        """
+        Parameters
+        -----------
+        address : (str, int)
+            host and port to listen to, port 0 to use any free port
+        latency : float
+            mean response time (seconds) of a request
+        error_rate : float
+            fraction of the requests answered with a 503 error
+        synonym_ratio : float
+            fraction of the names matched as a SYNONYM
+        none_ratio : float
+            fraction of the names without a match
+        """
+        super().__init__(address, _MockGbifApiHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.synonym_ratio = synonym_ratio
+        self.none_ratio = none_ratio
+        self.stats = {"match": 0, "species": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def api_url(self):
+        """base URL of the mock API"""
+        return "http://{}:{}/v1/".format(*self.server_address[:2])
+
+    def count(self, item):
+        with self._stats_lock:
+            self.stats[item] += 1
+
+
+class _MockGbifApiHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, message, status=200):
+        body = json.dumps(message).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urllib.parse.urlparse(self.path)
+        path = url.path.rstrip("/")
+
+        if path == "/stats":
+            with server._stats_lock:
+                return self._send_json(dict(server.stats))
+
+        if server.latency:
+            time.sleep(random.expovariate(1. / server.latency))
+        if random.random() < server.error_rate:
+            server.count("errors")
+            return self._send_json({"error": "Service unavailable"}, 503)
+
+        if path == "/v1/species/match":
+            parameters = dict(urllib.parse.parse_qsl(url.query))
+            server.count("match")
+            return self._send_json(match_message(parameters.get("name", ""),
+                                                 parameters.get("kingdom"),
+                                                 server.synonym_ratio,
+                                                 server.none_ratio))
+        elif path.startswith("/v1/species/"):
+            try:
+                usage_key = int(path.rsplit("/", 1)[1])
+            except ValueError:
+                return self._send_json({"error": "Not found"}, 404)
+            server.count("species")
+            return self._send_json(species_message(usage_key))
+        return self._send_json({"error": "Not found"}, 404)
+
+
+def main(argv=None):
+    """
+    Run the local stand-in of the GBIF species API
+    """
+    parser = argparse.ArgumentParser(description="""Run a local stand-in of
+        the GBIF species API (species/match and species/{key}) for
+        benchmarking. The request counts are available at /stats.
+        """)
+
+    parser.add_argument('--port', type=int, action='store', default=8090,
+                        help='port to listen to (default: 8090)')
+
+    parser.add_argument('--latency', type=float, action='store', default=0.,
+                        help='mean response time in seconds (default: 0)')
+
+    parser.add_argument('--error_rate', type=float, action='store',
+                        default=0.,
+                        help='fraction of the requests answered with a 503 error (default: 0)')
+
+    parser.add_argument('--synonym_ratio', type=float, action='store',
+                        default=0.1,
+                        help='fraction of the names matched as a SYNONYM (default: 0.1)')
+
+    parser.add_argument('--none_ratio', type=float, action='store',
+                        default=0.05,
+                        help='fraction of the names without a match (default: 0.05)')
+
+    args = parser.parse_args()
+
+    server = MockGbifApi(("127.0.0.1", args.port), args.latency,
+                         args.error_rate, args.synonym_ratio,
+                         args.none_ratio)
+    print("".join(["Mock GBIF API running at ", server.api_url]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    sys.exit(main())
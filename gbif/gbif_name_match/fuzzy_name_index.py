@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Local fuzzy matching of (misspelled) species names against a reference list
+of names
+
+created within the scope of Lifewatch - INBO
+"""
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+# fields of the match message (as by the GBIF API) filled from the reference
+REFERENCE_FIELDS = ["usageKey", "scientificName", "canonicalName", "status",
+                    "rank", "kingdom", "acceptedKey", "acceptedScientificName"]
+
+
+def _normalise_name(name):
+    """lower case name with single spaces"""
+    return " ".join(name.split()).lower()
+
+
+def _trigrams(name):
+    """distinct character trigrams of the (normalised) name, padded with
+    spaces to include the start and end of the name
+    """
+    padded = "".join(["  ", name, " "])
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, max_distance=None):
+    """Levenshtein distance between two strings; when max_distance is
+    provided, max_distance + 1 is returned as soon as the distance is known to
+    exceed max_distance
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    if max_distance is not None and len(first) - len(second) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(second) + 1))
+    for i, char_first in enumerate(first, 1):
+        current = [i]
+        for j, char_second in enumerate(second, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_first != char_second)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyNameIndex(object):
+    """
+    Index of a reference list of species names for fast local fuzzy
+    matching, e.g. to correct misspelled names without requests to the GBIF
+    API. Candidate names sharing enough character trigrams with the
+    requested name (and with a similar length) are looked up in the trigram
+    postings of the index, after which the edit distance decides on the best
+    match.
+
+    Example
+    -------
+    reference = FuzzyNameIndex('reference-list.tsv')
+    reference.match('Alopochen aegyptica')
+    """
+
+    def __init__(self, reference, namecol="scientificName",
+                 kingdomcol="kingdom", max_distance=2):
+        """
+        Parameters
+        -----------
+        reference : str | pd.DataFrame | list of str
+            reference list of names as a csv/tsv file or DataFrame (with the
+            names in namecol and optionally the other REFERENCE_FIELDS) or as
+            a list of names
+        namecol : str
+            column of the reference list with the names
+        kingdomcol : str
+            column of the reference list with the kingdom, if available
+        max_distance : int
+            maximum number of edits (insertions, deletions, substitutions) for
+            a fuzzy match
+        """
+        if isinstance(reference, str):
+            delimiter = "\t" if reference.endswith("tsv") else ","
+            reference = pd.read_csv(reference, sep=delimiter,
+                                    encoding="utf-8", dtype=object)
+        elif not isinstance(reference, pd.DataFrame):
+            reference = pd.DataFrame({namecol: list(reference)})
+        reference = reference.dropna(subset=[namecol])
+        reference = reference.drop_duplicates(subset=[namecol]
+                                              + ([kingdomcol] if kingdomcol in
+                                                 reference.columns else []))
+
+        self.max_distance = max_distance
+        self._names = [_normalise_name(name) for name in reference[namecol]]
+        if kingdomcol in reference.columns:
+            self._kingdoms = [None if pd.isnull(kingdom) else kingdom.lower()
+                              for kingdom in reference[kingdomcol]]
+        else:
+            self._kingdoms = [None] * len(self._names)
+
+        # reference records as provided in the match messages
+        records = pd.DataFrame(index=reference.index)
+        for field in REFERENCE_FIELDS:
+            if field in reference.columns:
+                records[field] = reference[field]
+        records["scientificName"] = reference[namecol]
+        if "acceptedKey" not in records.columns and \
+                "usageKey" in records.columns:
+            records["acceptedKey"] = records["usageKey"]
+            records["acceptedScientificName"] = records["scientificName"]
+        records = records.astype(object).where(records.notnull(), None)
+        self._records = records.to_dict(orient="records")
+
+        self._lengths = np.array([len(name) for name in self._names])
+        self._exact = defaultdict(list)
+        postings = defaultdict(list)
+        for idx, name in enumerate(self._names):
+            self._exact[name].append(idx)
+            for trigram in _trigrams(name):
+                postings[trigram].append(idx)
+        self._postings = {trigram: np.array(ids, dtype=np.int32)
+                          for trigram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self._names)
+
+    def close(self):
+        """for compatibility with BackboneIndex; nothing to close"""
+        pass
+
+    def _in_kingdom(self, idx, kingdom):
+        return kingdom is None or self._kingdoms[idx] in (None, kingdom)
+
+    def search(self, species_name, kingdom=None):
+        """find the closest reference name(s)
+
+        Parameters
+        ----------
+        species_name : str
+            species name to look for
+        kingdom : str
+            if provided, only reference names of this kingdom (or without a
+            kingdom) are considered
+
+        Returns
+        -------
+        candidates : list of int
+            position in the reference list of the closest names
+        distance : int | None
+            edit distance of the closest names; None if no name within
+            max_distance
+        """
+        name = _normalise_name(species_name)
+        if kingdom is not None:
+            kingdom = kingdom.lower()
+
+        exact = [idx for idx in self._exact.get(name, [])
+                 if self._in_kingdom(idx, kingdom)]
+        if exact:
+            return exact, 0
+
+        # each edit changes at most 3 trigrams of the name, so candidates
+        # share at least min_shared trigrams and have a similar length
+        trigrams = _trigrams(name)
+        min_shared = len(trigrams) - 3 * self.max_distance
+        if min_shared > 0:
+            postings = [self._postings[trigram] for trigram in trigrams
+                        if trigram in self._postings]
+            if not postings:
+                return [], None
+            shared = np.bincount(np.concatenate(postings),
+                                 minlength=len(self._names))
+            candidates = np.flatnonzero(shared >= min_shared)
+            # most similar candidates first, tightening the distance cutoff
+            candidates = candidates[np.argsort(-shared[candidates],
+                                               kind="stable")]
+        else:
+            candidates = np.arange(len(self._names))
+        candidates = candidates[np.abs(self._lengths[candidates] - len(name))
+                                <= self.max_distance]
+
+        best, best_distance = [], self.max_distance + 1
+        for idx in candidates.tolist():
+            if abs(self._lengths[idx] - len(name)) >= best_distance \
+                    or not self._in_kingdom(idx, kingdom):
+                continue
+            distance = edit_distance(name, self._names[idx],
+                                     max_distance=best_distance)
+            if distance < best_distance:
+                best, best_distance = [idx], distance
+            elif distance == best_distance:
+                best.append(idx)
+        if not best:
+            return [], None
+        return best, best_distance
+
+    def match(self, species_name, kingdom=None, strict=True):
+        """match a single name against the reference list
+
+        Parameters
+        ----------
+        species_name : str
+            species name, possibly misspelled
+        kingdom : str
+            kingdom of the species
+        strict : boolean
+            for compatibility with the API matching; names are only matched
+            to the reference list itself
+
+        Returns
+        -------
+        message : dict
+            the REFERENCE_FIELDS of the closest reference name, with a
+            matchType EXACT or FUZZY and a confidence (0-100) decreasing with
+            the edit distance; when no name is found within max_distance only
+            the matchType NONE
+        """
+        if pd.isnull(species_name):
+            return {"matchType": "NONE"}
+        if pd.isnull(kingdom):
+            kingdom = None
+        candidates, distance = self.search(species_name, kingdom)
+        if not candidates:
+            return {"matchType": "NONE No match in the reference list"}
+
+        message = {field: None for field in REFERENCE_FIELDS}
+        message.update(self._records[candidates[0]])
+        name_length = max(len(_normalise_name(species_name)),
+                          len(self._names[candidates[0]]))
+        confidence = 100 * (1 - distance / name_length)
+        if len(candidates) > 1:
+            confidence -= 10  # ambiguous
+        message["confidence"] = max(0, int(round(confidence)))
+        message["matchType"] = "EXACT" if distance == 0 else "FUZZY"
+        return message
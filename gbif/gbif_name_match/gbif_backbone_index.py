@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Offline matching of species names against a local index of the GBIF
+backbone taxonomy
+
+created within the scope of Lifewatch - INBO
+"""
+
+import csv
+import sys
+import sqlite3
+import argparse
+import threading
+
+import pandas as pd
+
+# columns of the backbone Taxon.tsv used for the index
+BACKBONE_COLUMNS = ["taxonID", "acceptedNameUsageID", "scientificName",
+                    "canonicalName", "taxonRank", "taxonomicStatus",
+                    "kingdom"]
+
+# preference of the taxonomic status when a name has multiple candidates
+STATUS_PREFERENCE = ["ACCEPTED", "DOUBTFUL"]
+
+
+def _normalise_name(name):
+    """lower case name with single spaces, used as index key"""
+    return " ".join(name.split()).lower()
+
+
+def _gbif_term(value):
+    """convert a backbone rank/status (e.g. homotypic synonym) into the
+    terms used by the GBIF API (e.g. HOMOTYPIC_SYNONYM)
+    """
+    if pd.isnull(value):
+        return None
+    return value.strip().upper().replace(" ", "_")
+
+
+def build_backbone_index(taxon_file, index_file, chunksize=500000):
+    """build the local index from the Taxon.tsv file of the GBIF backbone
+    taxonomy (Darwin Core Archive, https://hosted-datasets.gbif.org/datasets/backbone/)
+
+    Parameters
+    ----------
+    taxon_file : str
+        path to the Taxon.tsv file of the backbone archive
+    index_file : str
+        SQLite file to write the index to (overwritten when existing)
+    chunksize : int
+        number of rows of the taxon file to read at once
+    """
+    connection = sqlite3.connect(index_file)
+    connection.executescript("""
+        DROP TABLE IF EXISTS taxa;
+        CREATE TABLE taxa (
+            usageKey INTEGER PRIMARY KEY,
+            acceptedKey INTEGER,
+            scientificName TEXT,
+            canonicalName TEXT,
+            scientificNameKey TEXT,
+            canonicalNameKey TEXT,
+            rank TEXT,
+            status TEXT,
+            kingdom TEXT);
+        """)
+    reader = pd.read_csv(taxon_file, sep="\t", usecols=BACKBONE_COLUMNS,
+                         dtype=object, quoting=csv.QUOTE_NONE,
+                         encoding="utf-8", chunksize=chunksize)
+    n_taxa = 0
+    for taxa in reader:
+        rows = zip(taxa["taxonID"].astype("int64"),
+                   pd.to_numeric(taxa["acceptedNameUsageID"]).astype("Int64"),
+                   taxa["scientificName"], taxa["canonicalName"],
+                   taxa["scientificName"].fillna("").map(_normalise_name),
+                   taxa["canonicalName"].fillna("").map(_normalise_name),
+                   taxa["taxonRank"].map(_gbif_term),
+                   taxa["taxonomicStatus"].map(_gbif_term),
+                   taxa["kingdom"])
+        connection.executemany(
+            "INSERT INTO taxa VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((int(key), None if pd.isnull(accepted) else int(accepted),
+              *[None if pd.isnull(value) else value for value in other])
+             for key, accepted, *other in rows))
+        n_taxa += len(taxa)
+        print("".join(["Indexed ", str(n_taxa), " taxa."]))
+    connection.executescript("""
+        CREATE INDEX taxa_scientific_name ON taxa (scientificNameKey);
+        CREATE INDEX taxa_canonical_name ON taxa (canonicalNameKey);
+        """)
+    connection.commit()
+    connection.close()
+
+
+class BackboneIndex(object):
+    """
+    Match species names against a local index of the GBIF backbone, as
+    created by `build_backbone_index`, without any request to the GBIF API.
+    The messages contain the same fields as `match_species_name` of the
+    gbif_species_name_match module.
+
+    Example
+    -------
+    backbone = BackboneIndex('backbone.sqlite')
+    backbone.match('Alopochen aegyptiaca', kingdom='Animalia')
+    """
+
+    def __init__(self, index_file):
+        """
+        Parameters
+        -----------
+        index_file : str
+            SQLite file with the backbone index
+        """
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            "".join(["file:", index_file, "?mode=ro"]), uri=True,
+            check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """close the index file"""
+        self._connection.close()
+
+    def _query(self, query, parameters):
+        with self._lock:
+            return [dict(row) for row in
+                    self._connection.execute(query, parameters).fetchall()]
+
+    def _candidates(self, species_name, kingdom=None):
+        """taxa with the name as scientific name or, if none, as canonical
+        name; restricted to the kingdom when provided
+        """
+        name_key = _normalise_name(species_name)
+        for column in ["scientificNameKey", "canonicalNameKey"]:
+            query = "".join(["SELECT * FROM taxa WHERE ", column, " = ?"])
+            parameters = [name_key]
+            if kingdom:
+                query += " AND lower(kingdom) = ?"
+                parameters.append(kingdom.lower())
+            candidates = self._query(query, parameters)
+            if candidates:
+                return candidates
+        return []
+
+    def accepted_key(self, usage_key):
+        """get the acceptedKey and acceptedScientificName for a usageKey of
+        the backbone; if not available, empty string returned
+        """
+        taxa = self._query("""SELECT accepted.usageKey, accepted.scientificName
+                              FROM taxa JOIN taxa AS accepted
+                              ON taxa.acceptedKey = accepted.usageKey
+                              WHERE taxa.usageKey = ?""", [usage_key])
+        if taxa:
+            return taxa[0]["usageKey"], taxa[0]["scientificName"]
+        return "", ""
+
+    def match(self, species_name, kingdom=None, strict=True):
+        """match a single name against the backbone
+
+        Parameters
+        ----------
+        species_name : str
+            species name, preferably the Gbif proposed name
+        kingdom : str
+            kingdom of the species
+        strict : boolean
+            for compatibility with the API matching; the local index never
+            matches a taxon of the upper classification
+
+        Returns
+        -------
+        message : dict
+            usageKey, scientificName, canonicalName, rank, status, kingdom,
+            matchType, confidence, acceptedKey and acceptedScientificName or,
+            when no match is found, only the matchType
+        """
+        if pd.isnull(species_name):
+            return {"matchType": "NONE"}
+        if pd.isnull(kingdom):
+            kingdom = None
+        candidates = self._candidates(species_name, kingdom)
+        if not candidates:
+            return {"matchType": "NONE No match in the local backbone index"}
+
+        # prefer accepted and doubtful names above synonyms, names without
+        # status last
+        def _preference(taxon):
+            if taxon["status"] in STATUS_PREFERENCE:
+                return STATUS_PREFERENCE.index(taxon["status"])
+            if taxon["status"] is None:
+                return len(STATUS_PREFERENCE) + 1
+            return len(STATUS_PREFERENCE)
+        candidates.sort(key=_preference)
+        taxon = candidates[0]
+        # the status is empty (NULL) for some backbone taxa
+        status = taxon["status"] or ""
+
+        message = {"usageKey": taxon["usageKey"],
+                   "scientificName": taxon["scientificName"],
+                   "canonicalName": taxon["canonicalName"],
+                   "rank": taxon["rank"],
+                   "status": taxon["status"],
+                   "kingdom": taxon["kingdom"],
+                   "matchType": "EXACT",
+                   "confidence": 99 if len(candidates) == 1 else 90}
+        if "SYNONYM" in status or status == "MISAPPLIED":
+            accepted_key, accepted_name = self.accepted_key(taxon["usageKey"])
+            message["acceptedUsageKey"] = accepted_key
+        else:
+            accepted_key = taxon["usageKey"]
+            accepted_name = taxon["scientificName"]
+        message["acceptedKey"] = str(accepted_key)
+        message["acceptedScientificName"] = accepted_name
+        return message
+
+
+def main(argv=None):
+    """
+    Build the local backbone index from the Taxon.tsv file of the GBIF
+    backbone taxonomy
+    """
+    parser = argparse.ArgumentParser(description="""Build a local index of
+        the GBIF backbone taxonomy for offline name matching, using the
+        Taxon.tsv file of the backbone Darwin Core Archive.
+        """)
+
+    parser.add_argument('taxonfile', type=str,
+                        help='the relative path and filename of the backbone Taxon.tsv file')
+
+    parser.add_argument('indexfile', type=str,
+                        help='the relative path and filename of the SQLite index file to create')
+
+    args = parser.parse_args()
+
+    print("Building the backbone index...")
+    build_backbone_index(args.taxonfile, args.indexfile)
+    print("".join(["saving to file ", args.indexfile, "...done!"]))
+
+if __name__ == "__main__":
+    sys.exit(main())
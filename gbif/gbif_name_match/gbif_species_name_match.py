@@ -4,8 +4,22 @@ Author: Stijn Van Hoey
 created within the scope of Lifewatch - INBO
 """
 
+import os
+import re
+import csv
 import sys
+import glob
+import json
+import time
+import random
+import hashlib
 import argparse
+import importlib
+import threading
+from itertools import compress, islice
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import requests
 
 # urllib is used to escape spaces, ampersands. 
@@ -13,9 +27,230 @@ import requests
 # for tuples of parameters, use: urllib.parse.urlencode(parameters)
 import urllib.parse
 
-import pandas as pd
+from response_cache import ResponseCache
+from match_progress import MatchProgress
 
-def extract_gbif_accepted_key(usage_key, addname=True):
+
+class _LazyModule(object):
+    """module imported on first use, keeping the start of the command line
+    tool fast when no DataFrame is needed (see `_extract_species_information_lean`)
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+np = _LazyModule("numpy")
+pd = _LazyModule("pandas")
+
+# settings of the HTTP connections to the GBIF API
+GBIF_API_URL = "https://api.gbif.org/v1/"
+TIMEOUT = 30  # seconds to wait for the API to respond
+MAX_RETRIES = 5  # number of retries of a failing request
+BACKOFF_FACTOR = 0.5  # base waiting time (seconds) between retries
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_REQUESTS_PER_SECOND = None  # limit on the request rate, None for no limit
+# number of distinct (most recently used) names of which the matches are kept
+# for reuse in between the chunks of a large file
+MAX_REUSED_MATCHES = 1000000
+
+# GBIF API terms stored as nullable integer and categorical columns
+INTEGER_TERMS = ["usageKey", "acceptedKey", "acceptedUsageKey", "confidence",
+                 "kingdomKey", "phylumKey", "classKey", "orderKey",
+                 "familyKey", "genusKey", "speciesKey"]
+CATEGORICAL_TERMS = ["status", "rank", "matchType"]
+
+# file extensions of the Parquet and Feather (Arrow IPC) file formats, other
+# files are handled as csv/tsv
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+FEATHER_EXTENSIONS = ('.feather', '.arrow', '.ipc')
+
+# regular expression substitutions of the name normalisation steps, applied
+# in this order; the case step capitalises the genus and lowers the epithets
+_SPACES = [(r"\s+", " "), (r"^ | $", "")]
+_RANK_MARKERS = (r"(?i:(?:subsp|ssp|var|subvar|fo?|subf|nothosubsp|nothovar"
+                 r"|cv)\.|forma)")
+# author name particles, e.g. de Candolle
+_PARTICLES = r"(?:de|van|von|du|da|der|den|la|le)"
+# subgenus: a single capitalised word in brackets followed by an epithet
+_SUBGENUS = (r"\([A-Z][a-z-]+\) (?!" + _PARTICLES + r" |" + _RANK_MARKERS +
+             r" )[a-z\u00d7]")
+NORMALISATION_STEPS = {
+    "whitespace": _SPACES,
+    # sp., spp., cf. and aff. qualifiers
+    "qualifiers": [(r"(?i)(?<!\S)(?:sp|spp|cf|aff)\.?(?!\S)", "")] + _SPACES,
+    # authorship: anything after the genus (and subgenus) and the lower case
+    # (or all capitals) epithets and rank markers, e.g. starting with a
+    # capital, a bracket or a comma, up to the next infraspecific rank marker
+    # (keeping the infraspecific epithets) or the end of the name
+    "authorship": [(r"(?<=\S)(?: (?!(?!" + _PARTICLES + r" )"
+                    r"(?:[a-z\u00d7][^\s(),]*|[A-Z][A-Z-]{2,}(?=\s|$))|"
+                    + _RANK_MARKERS + r" |" + _SUBGENUS + r")|(?=[(,]))"
+                    r".*?(?= " + _RANK_MARKERS + r" [a-z\u00d7]|$)", "")],
+    "case": None,
+}
+
+# column with the hash of the matched name and kingdom of each row, used to
+# detect new and edited rows in an incremental run
+NAME_HASH_COLUMN = "gbifapi_nameHash"
+
+# column with the row number in the full species list of each row of a shard,
+# used to restore the original row order when merging the shards
+ROW_NUMBER_COLUMN = "shard_rowNumber"
+
+# column of the alternatives table with the row of the species list the
+# alternative matches belong to
+ALTERNATIVES_ROW_COLUMN = "rowNumber"
+
+_session = None
+_session_lock = threading.Lock()
+_pool_size = 0
+_progress = None  # MatchProgress of the running extract_species_information
+
+class _RateLimiter(object):
+    """spread the requests of all threads evenly in time, allowing at most
+    `rate` requests per second
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_slot = 0.
+
+    def reserve(self, rate):
+        """reserve the next request slot and return the seconds to wait for
+        it
+        """
+        if not rate:
+            return 0.
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1. / rate
+        return slot - now
+
+    def wait(self, rate):
+        """block until the next request is allowed"""
+        delay = self.reserve(rate)
+        if delay > 0:
+            time.sleep(delay)
+
+_rate_limiter = _RateLimiter()
+
+def get_session(pool_size=None):
+    """get the HTTP session used for the GBIF API requests
+
+    A single session is shared by all threads, keeping the connections to the
+    API alive in between requests instead of creating a new connection for
+    each request. The connection pool holds (at least) `pool_size`
+    connections, one for each worker thread.
+    """
+    global _session, _pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        pool_size = max(pool_size or 0, 10)
+        if pool_size > _pool_size:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=pool_size)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+            _pool_size = pool_size
+        return _session
+
+def _retry_wait(attempt, status_code=None, headers=None):
+    """seconds to wait before retrying a request
+
+    The Retry-After header of a 429 (too many requests) response is honoured,
+    otherwise an exponential backoff with random jitter is used.
+    """
+    if status_code == 429:
+        try:
+            return float(headers["Retry-After"])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, BACKOFF_FACTOR)
+
+@contextmanager
+def _instrumented(progress):
+    """activate the progress instrumentation of the requests and report the
+    final state when done
+    """
+    global _progress
+    if progress is None:
+        yield
+        return
+    progress.start()
+    _progress = progress
+    try:
+        yield
+    finally:
+        _progress = None
+        progress.finish()
+
+def _endpoint(request):
+    """name of the GBIF API endpoint of the request, match or species"""
+    return 'match' if '/species/match' in request else 'species'
+
+def _get(request):
+    """GET request to the GBIF API, retrying on connection errors, timeouts
+    and server errors
+    """
+    progress = _progress
+    if progress is None:
+        return _get_with_retries(request)[0]
+    progress.request_started()
+    started = time.monotonic()
+    retries = 0
+    try:
+        response, retries = _get_with_retries(request)
+        return response
+    finally:
+        progress.request_finished(_endpoint(request),
+                                  time.monotonic() - started, retries)
+
+def _get_with_retries(request):
+    """GET request with retries, returning the response and the number of
+    retries
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        _rate_limiter.wait(MAX_REQUESTS_PER_SECOND)
+        try:
+            response = get_session().get(request, timeout=TIMEOUT)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_wait(attempt))
+            continue
+        if response.status_code not in RETRY_STATUS_CODES:
+            return response, attempt
+        if attempt == MAX_RETRIES:
+            response.raise_for_status()
+        time.sleep(_retry_wait(attempt, response.status_code,
+                               response.headers))
+
+def _request_json(request, cache=None):
+    """get the json message of an API request, using the cache when
+    provided; only successful responses are cached
+    """
+    if cache is not None:
+        message = cache.get(request)
+        if _progress is not None:
+            _progress.cache_lookup(message is not None)
+        if message is not None:
+            return message
+    response = _get(request)
+    message = response.json()
+    if cache is not None and response.ok:
+        cache.set(request, message)
+    return message
+
+def extract_gbif_accepted_key(usage_key, addname=True, cache=None):
     """get the acceptedKey and acceptedScientificName for any usageKey of 
     Gbif; if not available, empty string returned
     
@@ -23,6 +258,8 @@ def extract_gbif_accepted_key(usage_key, addname=True):
     -----------
     usage_key : int
         usage_key as provided by GBIF for a specific species
+    cache : None | ResponseCache
+        persistent cache of the API responses
     
     Returns
     --------
@@ -31,9 +268,18 @@ def extract_gbif_accepted_key(usage_key, addname=True):
     acceptedScientificName : str
         scientific name of the accepted name synonym
     """
-    base_string = "http://api.gbif.org/v1/species/"
-    request = base_string + urllib.parse.quote_plus(str(usage_key))
-    message = requests.get(request).json()
+    message = _request_json(_accepted_key_request(usage_key), cache)
+    return _parse_accepted_key(message)
+
+def _accepted_key_request(usage_key):
+    """API request URL for the species information of a usageKey"""
+    base_string = GBIF_API_URL + "species/"
+    return base_string + urllib.parse.quote_plus(str(usage_key))
+
+def _parse_accepted_key(message):
+    """extract the acceptedKey and acceptedScientificName of the species
+    information message; if not available, empty string returned
+    """
     if "acceptedKey" in message.keys():
         acceptedKey = message["acceptedKey"]
     else:
@@ -47,7 +293,7 @@ def extract_gbif_accepted_key(usage_key, addname=True):
     return acceptedKey, acceptedScientificName
 
 def extract_gbif_species_names_info(species_name, kingdom=None, 
-                                    strict=True, verbose=False):
+                                    strict=True, verbose=False, cache=None):
     """API request to Gbif for species name info
     
     Parameters
@@ -62,26 +308,34 @@ def extract_gbif_species_names_info(species_name, kingdom=None,
     verbose:
         if true it shows alternative matches which were considered but then 
         rejected
+    cache : None | ResponseCache
+        persistent cache of the API responses
     
     Info
     ----
     http://www.gbif.org/developer/species
      """
-    base_string = 'http://api.gbif.org/v1/species/match?'
+    request = _species_match_request(species_name, kingdom, strict, verbose)
+    if request:
+        return _request_json(request, cache)
+    else:
+        return None
+
+def _species_match_request(species_name, kingdom=None, strict=True,
+                           verbose=False):
+    """API request URL for the species name match; None if no name is
+    provided
+    """
+    base_string = GBIF_API_URL + 'species/match?'
     
-    if not pd.isnull(kingdom) and not pd.isnull(species_name):
+    if not _is_missing(kingdom) and not _is_missing(species_name):
         request_parameters = {'verbose': str(verbose), 'strict': str(strict), 'kingdom': kingdom, 'name': species_name}
-        request = base_string + urllib.parse.urlencode(request_parameters)
-        # print(request)
-        return requests.get(request).json()
-    elif pd.isnull(kingdom) and not pd.isnull(species_name):
+        return base_string + urllib.parse.urlencode(request_parameters)
+    elif _is_missing(kingdom) and not _is_missing(species_name):
         request_parameters = {'verbose': str(verbose), 'strict': str(strict), 'name': species_name}
-        request = base_string + urllib.parse.urlencode(request_parameters)
-        # print(request)
-        return requests.get(request).json()
-
+        return base_string + urllib.parse.urlencode(request_parameters)
     else:
-        return None    
+        return None
 
 def _get_json_species_dtypes(message):    
     """extract the dtypes of the parsed json-file
@@ -100,7 +354,7 @@ def _derive_scientific_name_column(dfcolnames):
        
     (assuming always a single column with this type of information)
     """
-    column_names = dfcolnames.tolist()
+    column_names = list(dfcolnames)
     lower_names = [name.lower() for name in column_names]
     
     # check for scientific name
@@ -138,7 +392,7 @@ def _derive_kingdom_column(dfcolnames):
     
     (assuming always a single column with this type of information)
     """
-    column_names = dfcolnames.tolist()
+    column_names = list(dfcolnames)
     lower_names = [name.lower() for name in column_names]
     
     # check for kingdom
@@ -150,80 +404,351 @@ def _derive_kingdom_column(dfcolnames):
                 
     return kingdomcol 
 
-def add_acceptkey_to_message(message):
+def add_acceptkey_to_message(message, cache=None):
     """check if acceptkey should be added
     
     if synonym or misapplied in the status -> request for acceptedkey,
     if doubt or accepted -> existing usagekey is taken
     """
-    if "SYNONYM" in message['status'] or \
-                                message['status'] == "MISAPPLIED":
-        accepted_key, accepted_scientific_name = \
-                        extract_gbif_accepted_key(message['usageKey'])
-        message["acceptedKey"] = str(accepted_key)
-        message["acceptedScientificName"] = accepted_scientific_name   
+    if _is_synonym(message):
+        _set_accepted_key(message,
+                          *extract_gbif_accepted_key(message['usageKey'],
+                                                     cache=cache))
     else:
-        message["acceptedKey"] = str(message['usageKey'])  
-        message["acceptedScientificName"] = message['scientificName']
-        
-def extract_species_information(species_list_in, 
-                                output=None,
-                                update_cols=False,                                 
-                                api_terms=["usageKey", 
-                                           "scientificName", 
-                                           "canonicalName",
-                                           "status", 
-                                           "rank", 
-                                           "matchType", 
-                                           "confidence"], 
-                                namecol=None, 
-                                kingdomcol=None,
-                                strict=True
-                                ):
-    """read tsv, request the information from GBIF and add the required 
-    information from the mapping
-    
+        _set_accepted_key(message, message['usageKey'],
+                          message['scientificName'])
+
+def _set_accepted_key(message, accepted_key, accepted_scientific_name):
+    """add the acceptedKey and acceptedScientificName items to the message"""
+    message["acceptedKey"] = str(accepted_key)
+    message["acceptedScientificName"] = accepted_scientific_name
+
+def add_accepted_keys(messages, cache=None, workers=1):
+    """add the acceptedKey and acceptedScientificName to a collection of
+    matched messages, requesting the accepted name of each distinct synonym
+    usageKey only once
+
     Parameters
     ----------
-    species_list_in : str | pd.DataFrame
-        filename (full path) of the tsv file listing the species interested in 
-        or pandas DataFrame with the respective columns
-    update_cols : boolean
-        if True, the columns with the GBIF API terms are updated; when False, 
-        the api terms are added, with each gbif-term column named gbifapi_*
-    api_terms : list | 'all'
-        the terms from the API to store in the CSV file
-    output : None | str
-        if None, output is provided as output; otherwise a filename to save the
-        tsv file
+    messages : iterable of dict
+        API responses of the name match request; messages without a match
+        are left untouched
+    cache : None | ResponseCache
+        persistent cache of the API responses
+    workers : int
+        number of accepted names requested concurrently
+
+    Returns
+    -------
+    accepted : dict
+        acceptedKey and acceptedScientificName for each synonym usageKey
+    """
+    synonyms = []
+    for message in messages:
+        if 'status' not in message:
+            continue
+        if _is_synonym(message):
+            synonyms.append(message)
+        else:
+            _set_accepted_key(message, message['usageKey'],
+                              message['scientificName'])
+
+    usage_keys = list(dict.fromkeys(message['usageKey']
+                                    for message in synonyms))
+    accepted = dict(zip(usage_keys,
+                        _map(lambda usage_key: extract_gbif_accepted_key(
+                                 usage_key, cache=cache),
+                             usage_keys, workers)))
+    for message in synonyms:
+        _set_accepted_key(message, *accepted[message['usageKey']])
+    return accepted
+
+def _map(function, items, workers=1):
+    """apply the function to each of the items, using a pool of threads when
+    more than a single worker is requested; the order of the items is kept
+    """
+    if workers > 1 and len(items) > 1:
+        get_session(workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(function, items))
+    else:
+        return [function(item) for item in items]
+
+def _is_synonym(message):
+    """check if the accepted name of a matched message is to be requested"""
+    return "SYNONYM" in message['status'] or \
+                                message['status'] == "MISAPPLIED"
+
+def _is_match(species_info):
+    """check if the response of the match request contains a match"""
+    return bool(species_info) and (not species_info['matchType'] == 'NONE')
+
+def _no_match_message(species_info):
+    """message stored for names without a match"""
+    if species_info and 'note' in species_info:
+        return {'matchType': 'NONE ' + species_info['note']}
+    else:
+        return {'matchType': 'NONE'}
+
+def _is_missing(value):
+    """check for a missing value (None, NaN or pd.NA) as pd.isnull does for
+    a single value, without importing pandas
+    """
+    if value is None:
+        return True
+    try:
+        return bool(value != value)
+    except TypeError:  # pd.NA
+        return True
+
+def _normalisation_steps(normalise):
+    """steps of the name normalisation: all for True, none for False/None"""
+    if normalise is True:
+        return list(NORMALISATION_STEPS)
+    steps = list(normalise or [])
+    for step in steps:
+        if step not in NORMALISATION_STEPS:
+            raise Exception("".join(["Unknown normalisation step ", step,
+                                     ", use one of ",
+                                     ", ".join(NORMALISATION_STEPS)]))
+    return [step for step in NORMALISATION_STEPS if step in steps]
+
+def normalise_name(species_name, normalise=True):
+    """canonical form of a single name used as lookup key, see
+    `normalise_names`
+    """
+    if _is_missing(species_name):
+        return None
+    for step in _normalisation_steps(normalise):
+        if step == "case":
+            species_name = species_name.capitalize()
+        else:
+            for pattern, replacement in NORMALISATION_STEPS[step]:
+                species_name = re.sub(pattern, replacement, species_name)
+    return species_name or None
+
+def normalise_names(names, normalise=True):
+    """canonical form of the names used as lookup key, enabling names that
+    only differ in whitespace, case, trailing authorship or sp./cf.
+    qualifiers to share a single request
+
+    Parameters
+    ----------
+    names : pd.Series
+        species names
+    normalise : True | list of str
+        normalisation steps to apply (whitespace, qualifiers, authorship,
+        case), True for all of them
+
+    Returns
+    -------
+    names : pd.Series
+        normalised names (object dtype), None for missing or empty names
+    """
+    # apply the (vectorised) steps once for each distinct name
+    codes, uniques = pd.factorize(names)
+    # object dtype: the patterns require Python regular expressions
+    uniques = pd.Series([str(name) for name in uniques], dtype=object)
+    for step in _normalisation_steps(normalise):
+        if step == "case":
+            uniques = uniques.str.capitalize()
+        else:
+            for pattern, replacement in NORMALISATION_STEPS[step]:
+                uniques = uniques.str.replace(pattern, replacement,
+                                              regex=True)
+    uniques = uniques.where(uniques != "", None).to_numpy(dtype=object)
+    normalised = np.full(len(codes), None, dtype=object)
+    normalised[codes >= 0] = uniques[codes[codes >= 0]]
+    return pd.Series(normalised, index=names.index, dtype=object)
+
+def _lookup_key(species_name, kingdom):
+    """translate a name/kingdom pair into a hashable key for the request
+    reuse, with all missing values represented by None
+    """
+    if _is_missing(species_name):
+        species_name = None
+    if _is_missing(kingdom):
+        kingdom = None
+    return species_name, kingdom
+
+def match_species_name(species_name, kingdom=None, strict=True, cache=None):
+    """request the GBIF match for a single name and convert it into the
+    message as stored for each row of the species list
+
+    Parameters
+    ----------
+    species_name : str
+        species name, preferably the Gbif proposed name
+    kingdom : str
+        kingdom of the species
     strict : boolean
         add strict option to the api request as True or False
-    
+    cache : None | ResponseCache
+        persistent cache of the API responses
+
     Returns
     -------
-    species_list_fill : pd.DataFrame
-        filled version of the tsv table
+    message : dict
+        API response including acceptedKey and acceptedScientificName or,
+        when no match is found, only the matchType
+    """
+    species_info = extract_gbif_species_names_info(species_name, kingdom,
+                                                   strict=strict, cache=cache)
+    # check response and save
+    if _is_match(species_info):
+        # add extra item with acceptedKey
+        add_acceptkey_to_message(species_info, cache=cache)
+        return species_info
+    else:
+        return _no_match_message(species_info)
+
+def match_species_names(lookup_keys, strict=True, cache=None, workers=1,
+                        backbone=None, verbose=False):
+    """request the GBIF match for a collection of name/kingdom pairs
+
+    Parameters
+    ----------
+    lookup_keys : iterable of (str, str) tuples
+        unique species name and kingdom pairs, using None for missing values
+    strict : boolean
+        add strict option to the api request as True or False
+    cache : None | ResponseCache
+        persistent cache of the API responses
+    workers : int
+        number of names requested concurrently
+    backbone : None | BackboneIndex | FuzzyNameIndex
+        if provided, the names are matched offline against the local index
+        of the GBIF backbone or a reference list instead of requested to the
+        GBIF API
+    verbose : boolean
+        if True, the messages contain the alternative matches considered by
+        the GBIF API (alternatives)
+
+    Returns
+    -------
+    matched : dict
+        message of `match_species_name` for each of the name/kingdom pairs
+
+    Remark
+    ------
+    The names are matched first, after which the accepted names of the
+    matched synonyms are requested once for each distinct usageKey (see
+    `add_accepted_keys`).
+    """
+    lookup_keys = list(lookup_keys)
+    progress = _progress
+    if progress is not None:
+        progress.add_total(names=len(lookup_keys))
+
+    if backbone is not None:
+        matched = {lookup_key: backbone.match(*lookup_key, strict=strict)
+                   for lookup_key in lookup_keys}
+        if progress is not None:
+            progress.names_matched(len(lookup_keys))
+        return matched
+
+    def _match(lookup_key):
+        species_info = extract_gbif_species_names_info(*lookup_key,
+                                                       strict=strict,
+                                                       verbose=verbose,
+                                                       cache=cache)
+        if progress is not None:
+            progress.names_matched()
+        if _is_match(species_info):
+            return species_info
+        elif species_info and 'alternatives' in species_info:
+            return dict(_no_match_message(species_info),
+                        alternatives=species_info['alternatives'])
+        else:
+            return _no_match_message(species_info)
+
+    messages = _map(_match, lookup_keys, workers)
+    accepted = add_accepted_keys(messages, cache=cache, workers=workers)
+    n_synonyms = sum(1 for message in messages
+                     if 'status' in message and _is_synonym(message))
+    print(''.join(['Requested ', str(len(accepted)), ' accepted names for ',
+                   str(n_synonyms), ' matched synonyms.']))
+    return dict(zip(lookup_keys, messages))
+
+def _delimiter(filename):
+    """delimiter of a csv or tsv file, based on the file extension"""
+    if filename.endswith('tsv'):
+        return '\t'
+    else:
+        return ','
+
+def _file_format(filename):
+    """file format (csv, parquet or feather) based on the file extension;
+    csv is used for both comma and tab separated files
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    elif extension in FEATHER_EXTENSIONS:
+        return 'feather'
+    else:
+        return 'csv'
+
+def _read_table(filename, columns=None):
+    """read a csv/tsv, Parquet or Feather (Arrow IPC) file, optionally only
+    the given columns; csv/tsv files are read as text (dtype object)
+    """
+    file_format = _file_format(filename)
+    if file_format == 'parquet':
+        return pd.read_parquet(filename, columns=columns)
+    elif file_format == 'feather':
+        return pd.read_feather(filename, columns=columns)
+    else:
+        return pd.read_csv(filename, sep=_delimiter(filename), usecols=columns,
+                           encoding='utf-8', dtype=object)
+
+def _write_table(table, filename, delimiter=','):
+    """write to a csv/tsv (using delimiter), Parquet or Feather file, based
+    on the file extension; Parquet and Feather keep the column types
+    """
+    file_format = _file_format(filename)
+    if file_format == 'parquet':
+        table.to_parquet(filename, index=False)
+    elif file_format == 'feather':
+        table.reset_index(drop=True).to_feather(filename)
+    else:
+        table.to_csv(filename, sep=delimiter, index=False, encoding='utf-8')
+
+def _read_species_list(species_list_in):
+    """read the species list from a csv/tsv, Parquet or Feather file or take
+    the DataFrame
+
+    Returns
+    -------
+    species_list : pd.DataFrame
+        species list
+    delimiter : str
+        delimiter to use for a csv/tsv output file
     """
-    
     if isinstance(species_list_in, str):
-        # Reading in the files (csv or tsv)
-        if species_list_in.endswith('tsv'):
-            delimiter = '\t'
+        # Reading in the files (csv, tsv, parquet or feather)
+        if _file_format(species_list_in) == 'csv':
+            delimiter = _delimiter(species_list_in)
         else:
             delimiter = ','
-        species_list = pd.read_csv(species_list_in, sep=delimiter,
-                                   encoding='utf-8', dtype=object)
+        species_list = _read_table(species_list_in)
     elif isinstance(species_list_in, pd.DataFrame):
+        delimiter = ','
         species_list = species_list_in
     else:
         raise Exception('Input datatype not supported, use either str or a \
                             pandas DataFrame')
+    return species_list, delimiter
 
+def _name_columns(columns, namecol=None, kingdomcol=None):
+    """derive the scientific name and kingdom columns when not provided and
+    inform the user about the columns used
+    """
     # try to find out which columns the scientific name and kingdom have
     if not namecol:
-        namecol = _derive_scientific_name_column(species_list.columns)
+        namecol = _derive_scientific_name_column(columns)
     if not kingdomcol:
-        kingdomcol = _derive_kingdom_column(species_list.columns)
+        kingdomcol = _derive_kingdom_column(columns)
     
     # provide user information about column use
     if kingdomcol:
@@ -232,48 +757,338 @@ def extract_species_information(species_list_in,
     else:
         print(''.join(['Using only ', namecol, 
                        ' as name column for API request.']))    
-                       
-    # collect all API information
-    api_output = {}
-    for indx, row in species_list.iterrows():
-        # make request
-        if kingdomcol:
-            species_info = extract_gbif_species_names_info(row[namecol], 
-                                                           row[kingdomcol],
-                                                           strict=strict)   
-        else:
-            species_info = extract_gbif_species_names_info(row[namecol],
-                                                           strict=strict)                                                          
-        
-        # check response and save
-        if species_info and (not species_info['matchType'] == 'NONE'): 
-            # add extra item with acceptedKey
-            add_acceptkey_to_message(species_info)
-            # collect messages in dict
-            api_output[indx] = species_info
-            #dtypes_to_use = _get_json_species_dtypes(species_info)
-        elif species_info and 'note' in species_info:
-            api_output[indx] = {'matchType': 'NONE ' + species_info['note']}
+    return namecol, kingdomcol
+
+def _species_lookup_keys(species_list, namecol, kingdomcol=None,
+                         normalise=None):
+    """name/kingdom lookup key of each row of the species list, optionally
+    with normalised names (see `normalise_names`)
+    """
+    names = species_list[namecol]
+    if normalise:
+        names = normalise_names(names, normalise)
+    if kingdomcol:
+        kingdoms = species_list[kingdomcol]
+        if normalise:
+            kingdoms = normalise_names(kingdoms, ["whitespace", "case"])
+    else:
+        kingdoms = [None] * len(species_list)
+    return [_lookup_key(name, kingdom)
+            for name, kingdom in zip(names, kingdoms)]
+
+def _report_request_reuse(n_unique, n_rows, cache=None):
+    """inform the user about the number of requests saved"""
+    print(''.join(['Requested ', str(n_unique), ' unique names for ',
+                   str(n_rows), ' rows (', str(n_rows - n_unique),
+                   ' API requests saved).']))
+    if cache is not None:
+        print(''.join(['Used ', str(cache.hits), ' cached responses from ',
+                       cache.filename, '.']))
+
+def _api_terms_to_extract(api_terms, messages):
+    """GBIF API terms to add to the species list; all terms of the messages
+    when api_terms contains 'all'
+    """
+    available = dict.fromkeys(term for message in messages
+                              for term in message)
+    if 'all' in api_terms:
+        return list(available)
+    # add acceptedKey and acceptedScientificName as default required columns
+    terms = list(dict.fromkeys(list(api_terms) +
+                               ["acceptedKey", "acceptedScientificName"]))
+    # without any match (e.g. an empty chunk or shard), the terms are empty;
+    # only matched messages contain the acceptedKey
+    if not all(term in available for term in terms) and \
+            any("acceptedKey" in message for message in messages):
+        raise Exception('Not all names of api_terms available in request')
+    return terms
+
+def _slim_messages(matched, api_terms):
+    """keep only the api_terms (and accepted name) of the messages, to limit
+    the memory of the matches kept in between chunks
+    """
+    if 'all' in api_terms:
+        return matched
+    terms = set(api_terms) | {"acceptedKey", "acceptedScientificName"}
+    return {lookup_key: {term: value for term, value in message.items()
+                         if term in terms}
+            for lookup_key, message in matched.items()}
+
+def _evict_matches(matched, lookup_keys, *others):
+    """keep only the MAX_REUSED_MATCHES most recently used matches for reuse
+    in the next chunks, limiting the memory to the number of reused names
+    instead of all distinct names of the file
+
+    Parameters
+    ----------
+    matched : OrderedDict
+        matches kept in between chunks, least recently used first
+    lookup_keys : list
+        name/kingdom pairs of the chunk just processed
+    others : dict
+        other dicts keyed on the name/kingdom pairs (e.g. the alternatives),
+        evicted together with the matches
+    """
+    for lookup_key in dict.fromkeys(lookup_keys):
+        matched.move_to_end(lookup_key)
+    while len(matched) > MAX_REUSED_MATCHES:
+        lookup_key, _ = matched.popitem(last=False)
+        for other in others:
+            other.pop(lookup_key, None)
+
+def _term_values(values, term):
+    """typed column of the values of a GBIF API term: nullable integers for
+    the keys and confidence, categoricals for status, rank and matchType
+    """
+    values = pd.Series(values, dtype=object)
+    if term in INTEGER_TERMS:
+        # failed accepted name lookups are stored as empty string
+        return pd.to_numeric(values.mask(values == ""),
+                             errors='coerce').astype('Int64')
+    elif term in CATEGORICAL_TERMS:
+        return values.astype('category')
+    return values
+
+def _api_columns(lookup_keys, matched, api_terms, index, terms=None):
+    """gbifapi_* columns of the species list, built from the messages of the
+    distinct names and spread over the rows by their position; terms
+    overrules the terms derived from api_terms
+    """
+    position = {}
+    codes = np.fromiter((position.setdefault(lookup_key, len(position))
+                         for lookup_key in lookup_keys),
+                        dtype=np.intp, count=len(lookup_keys))
+    messages = [matched[lookup_key] for lookup_key in position]
+
+    columns = {}
+    if terms is None:
+        terms = _api_terms_to_extract(api_terms, messages)
+    for term in terms:
+        values = _term_values([message.get(term) for message in messages],
+                              term).take(codes)
+        values.index = index
+        # Put the gbifapi_ string in front of these keys
+        columns["".join(["gbifapi_", term])] = values
+    return pd.DataFrame(columns, index=index)
+
+def _name_hash(lookup_key):
+    """stable hash of a name/kingdom pair (independent of the Python session)
+    """
+    return hashlib.sha1(json.dumps(lookup_key).encode('utf-8')).hexdigest()[:16]
+
+def _incremental_rows(species_list, lookup_keys, api_terms):
+    """name hash of each row and the rows to (re)match in an incremental run:
+    new or edited rows (of which the stored name hash differs) and rows
+    without a match in the previous run
+
+    Returns
+    -------
+    hashes : list of str
+        name hash of each row
+    rematch : np.ndarray of bool | None
+        rows to (re)match; None when all rows are to be matched because the
+        species list misses the name hash or gbifapi_* columns
+    """
+    hashes = [_name_hash(lookup_key) for lookup_key in lookup_keys]
+    required = [] if 'all' in api_terms else \
+        ["".join(["gbifapi_", term]) for term in api_terms]
+    if NAME_HASH_COLUMN not in species_list.columns or \
+            not all(column in species_list.columns for column in required):
+        return hashes, None
+
+    rematch = species_list[NAME_HASH_COLUMN].to_numpy(dtype=object) != \
+        np.array(hashes, dtype=object)
+    if 'gbifapi_matchType' in species_list.columns:
+        match_type = species_list['gbifapi_matchType'].astype(object)
+        failed = match_type.isnull() | \
+            match_type.astype(str).str.startswith('NONE')
+    elif 'gbifapi_usageKey' in species_list.columns:
+        failed = species_list['gbifapi_usageKey'].isnull()
+    else:
+        failed = np.ones(len(species_list), dtype=bool)
+    return hashes, rematch | np.asarray(failed, dtype=bool)
+
+def _shard_rows(lookup_keys, shard, n_shards):
+    """boolean mask of the rows of which the name/kingdom pair belongs to the
+    shard; all rows with the same name and kingdom are in the same shard
+    """
+    return np.fromiter((int(_name_hash(lookup_key), 16) % n_shards == shard
+                        for lookup_key in lookup_keys),
+                       dtype=bool, count=len(lookup_keys))
+
+def _select_shard(species_list, rows, first_row=0):
+    """rows of the species list in the shard, with their row number in the
+    full species list (first_row being the row number of the first row of
+    species_list)
+    """
+    positions = np.flatnonzero(rows)
+    species_list = species_list.iloc[positions].copy()
+    species_list[ROW_NUMBER_COLUMN] = positions + first_row
+    return species_list
+
+def merge_shards(shard_files, output=None):
+    """merge the outputs of the shards of a species list, processed with the
+    shard and n_shards arguments of `extract_species_information`, into the
+    original row order
+
+    Parameters
+    ----------
+    shard_files : list of str | str
+        the output files of all shards or a glob pattern matching them, e.g.
+        'species-list.shard-*.tsv'
+    output : None | str
+        if provided, filename to write the merged species list to
+
+    Returns
+    -------
+    species_list : pd.DataFrame
+        merged species list, without the shard_rowNumber column
+    """
+    if isinstance(shard_files, str):
+        shard_files = sorted(glob.glob(shard_files))
+    if not shard_files:
+        raise Exception('No shard files to merge')
+    shards = [_read_table(shard_file) for shard_file in shard_files]
+    if not all(ROW_NUMBER_COLUMN in shard.columns for shard in shards):
+        raise Exception("".join(['Not all shard files contain the ',
+                                 ROW_NUMBER_COLUMN, ' column']))
+    species_list = pd.concat(shards, ignore_index=True)
+
+    row_numbers = pd.to_numeric(species_list[ROW_NUMBER_COLUMN]).to_numpy()
+    order = np.argsort(row_numbers, kind='stable')
+    if not (row_numbers[order] == np.arange(len(order))).all():
+        raise Exception('The shard files do not contain each row of the \
+                            species list exactly once, check for missing or \
+                            duplicate shards')
+    species_list = species_list.iloc[order].drop(columns=ROW_NUMBER_COLUMN)
+    species_list = species_list.reset_index(drop=True)
+    # categoricals with different categories per shard are combined as object
+    for column in shards[0].columns:
+        if isinstance(shards[0][column].dtype, pd.CategoricalDtype):
+            species_list[column] = species_list[column].astype('category')
+    print(''.join(['Merged ', str(len(species_list)), ' rows of ',
+                   str(len(shard_files)), ' shards.']))
+
+    if output:
+        if _file_format(shard_files[0]) == 'csv':
+            delimiter = _delimiter(shard_files[0])
         else:
-            api_output[indx] = {'matchType': 'NONE'}  
-    species_df = pd.DataFrame(api_output).transpose()
-    # put the dtypes to object:
-    for col in species_df.columns:
-        species_df[col] = species_df[col].astype(object)
-    
-    # drop non-required names
-    api_terms_to_extract = api_terms[:]
-    if 'all' not in api_terms_to_extract:
-        api_terms_to_extract.append("acceptedKey")  # add acceptedKey as default required column
-        api_terms_to_extract.append("acceptedScientificName")  # add acceptedScientificName as default required column
-        try:
-            species_df = species_df[api_terms_to_extract]       
-        except:
-            raise Exception('Not all names of api_terms available in request')          
+            delimiter = ','
+        _write_table(species_list, output, delimiter)
+    return species_list
+
+def _report_incremental(rematch):
+    """inform the user about the rows skipped in an incremental run"""
+    n_rematch = int(rematch.sum())
+    print(''.join(['Skipped ', str(len(rematch) - n_rematch),
+                   ' unchanged rows, matching ', str(n_rematch),
+                   ' new, edited or unmatched rows.']))
+
+def _merge_api_columns(species_list, species_df, rows):
+    """gbifapi_* columns of the species list with the rows replaced by the
+    (re)matched rows of species_df
+    """
+    positions = np.flatnonzero(rows)
+    columns = {}
+    for column in species_df.columns:
+        values = species_list[column].to_numpy(dtype=object, copy=True)
+        new_values = species_df[column].astype(object)
+        values[positions] = new_values.where(new_values.notnull(), None)
+        values = _term_values(values, column[len("gbifapi_"):])
+        values.index = species_list.index
+        columns[column] = values
+    return pd.DataFrame(columns, index=species_list.index)
+
+def _pop_alternatives(matched, api_terms):
+    """remove the alternatives from the messages, keeping only the api_terms
+    of each alternative match
+
+    Returns
+    -------
+    alternatives : dict
+        list of alternative matches for each of the name/kingdom pairs
+    """
+    alternatives = {}
+    for lookup_key, message in matched.items():
+        candidates = message.pop('alternatives', None) or []
+        if 'all' not in api_terms:
+            candidates = [{term: candidate.get(term) for term in api_terms}
+                          for candidate in candidates]
+        alternatives[lookup_key] = candidates
+    return alternatives
+
+def _alternatives_table(alternatives, lookup_keys, row_numbers, api_terms):
+    """long format table of the alternative matches of each row, with the
+    row number of the species list as foreign key (rowNumber) and the
+    position of the alternative (alternative, 1 for the first)
+    """
+    row_ids, ranks, records = [], [], []
+    for row_number, lookup_key in zip(row_numbers, lookup_keys):
+        for rank, candidate in enumerate(alternatives[lookup_key], 1):
+            row_ids.append(row_number)
+            ranks.append(rank)
+            records.append(candidate)
+    if 'all' in api_terms:
+        terms = list(dict.fromkeys(term for candidate in records
+                                   for term in candidate))
+    else:
+        terms = list(api_terms)
+    table = pd.DataFrame({ALTERNATIVES_ROW_COLUMN:
+                              np.array(row_ids, dtype='int64'),
+                          'alternative': np.array(ranks, dtype='int64')})
+    for term in terms:
+        table["".join(["gbifapi_", term])] = _term_values(
+            [candidate.get(term) for candidate in records], term)
+    return table
+
+def _row_numbers(species_list, rows=None, first_row=None):
+    """row number of each (selected) row of the species list: the row
+    number in the full species list of a shard, the position in the file
+    when first_row is provided or the index otherwise
+    """
+    if ROW_NUMBER_COLUMN in species_list.columns:
+        row_numbers = species_list[ROW_NUMBER_COLUMN].to_numpy()
+    elif first_row is not None:
+        row_numbers = np.arange(first_row, first_row + len(species_list))
+    else:
+        row_numbers = species_list.index.to_numpy()
+    if rows is not None:
+        row_numbers = row_numbers[rows]
+    return row_numbers
+
+def _fill_species_list(species_list, lookup_keys, matched, api_terms,
+                       update_cols, rows=None):
+    """add (or update) the api_terms of the API messages of each row to the
+    species list as gbifapi_* columns
+
+    Parameters
+    ----------
+    species_list : pd.DataFrame
+        species list
+    lookup_keys : list of (str, str) tuples
+        name/kingdom pair of each row of the species list
+    matched : dict
+        message for each of the name/kingdom pairs
+    api_terms : list | 'all'
+        the terms from the API to add
+    update_cols : boolean
+        update the existing gbifapi_* columns instead of adding them
+    rows : None | np.ndarray of bool
+        if provided, only these rows are updated (and only their lookup_keys
+        are given), the other rows keep the existing gbifapi_* columns
+    """
+    if rows is None:
+        species_df = _api_columns(lookup_keys, matched, api_terms,
+                                  species_list.index)
+    else:
+        # update the existing gbifapi_* columns of the rows
+        terms = [column[len("gbifapi_"):] for column in species_list.columns
+                 if column.startswith("gbifapi_")
+                 and column != NAME_HASH_COLUMN]
+        species_df = _merge_api_columns(
+            species_list, _api_columns(lookup_keys, matched, api_terms,
+                                       species_list.index[rows], terms), rows)
 
-    # Put the gbifapi_ string in front of these keys
-    species_df.columns = ["".join(["gbifapi_", term]) for term in species_df.columns]
-    
     if update_cols:
         for term in species_df.columns:
             if not term in species_list.columns:
@@ -295,26 +1110,604 @@ def extract_species_information(species_list_in,
                             the columns
                             """)
         # concatenate old and new (control naming)        
-        species_list_fill = pd.concat((species_list, species_df), axis=1)        
+        species_list_fill = pd.concat((species_list, species_df), axis=1)
+    return species_list_fill
 
-    if output:
-        species_list_fill.to_csv(output, sep=delimiter, 
-                                 index=False, 
-                                 encoding='utf-8')
-    return species_list_fill    
+def extract_species_information(species_list_in, 
+                                output=None,
+                                update_cols=False,                                 
+                                api_terms=["usageKey", 
+                                           "scientificName", 
+                                           "canonicalName",
+                                           "status", 
+                                           "rank", 
+                                           "matchType", 
+                                           "confidence"], 
+                                namecol=None, 
+                                kingdomcol=None,
+                                strict=True,
+                                cache=None,
+                                workers=1,
+                                chunksize=None,
+                                resume=False,
+                                backbone=None,
+                                progress=None,
+                                incremental=False,
+                                shard=None,
+                                n_shards=1,
+                                normalise=False,
+                                alternatives=None,
+                                postprocess=None
+                                ):
+    """read tsv, request the information from GBIF and add the required 
+    information from the mapping
+    
+    Parameters
+    ----------
+    species_list_in : str | pd.DataFrame
+        filename (full path) of the tsv file listing the species interested in 
+        or pandas DataFrame with the respective columns; csv/tsv, Parquet
+        (.parquet) and Feather/Arrow IPC (.feather, .arrow) files are
+        supported, based on the file extension
+    update_cols : boolean
+        if True, the columns with the GBIF API terms are updated; when False, 
+        the api terms are added, with each gbif-term column named gbifapi_*
+    api_terms : list | 'all'
+        the terms from the API to store in the CSV file
+    output : None | str
+        if None, output is provided as output; otherwise a filename to save the
+        tsv file (or csv, Parquet or Feather file, based on the extension)
+    strict : boolean
+        add strict option to the api request as True or False
+    cache : None | ResponseCache
+        persistent cache of the API responses, see `ResponseCache`
+    workers : int
+        number of names requested concurrently; the overall request rate is
+        limited by MAX_REQUESTS_PER_SECOND
+    chunksize : None | int
+        if provided, the input file is read, matched and appended to the
+        output file in chunks of chunksize rows, keeping the memory use
+        independent of the file size (requires a filename for both
+        species_list_in and output and explicit api_terms, not 'all')
+    resume : boolean
+        if True, continue an interrupted run processed in chunks, skipping
+        the rows already written according to the checkpoint file
+        (<output>.checkpoint)
+    backbone : None | BackboneIndex | FuzzyNameIndex
+        if provided, the names are matched offline against the local index
+        of the GBIF backbone (see gbif_backbone_index module) or fuzzy
+        matched against a reference list (see fuzzy_name_index module)
+        instead of requested to the GBIF API
+    progress : None | MatchProgress
+        if provided, collects and reports the progress, request timing and
+        cache use of the matching
+    incremental : boolean
+        if True, only new and edited rows and rows without a match are
+        (re)matched, based on the name hash stored in the gbifapi_nameHash
+        column by a previous incremental run; the other rows keep their
+        gbifapi_* columns
+    shard : None | int
+        if provided, only the rows of shard number shard (0 to n_shards - 1)
+        are processed, extended with their row number in the full species
+        list (shard_rowNumber column); see `merge_shards` to combine the
+        outputs of all shards
+    n_shards : int
+        number of shards the rows are divided in, based on a hash of the name
+        and kingdom
+    normalise : boolean | list of str
+        if True (or a list of steps), the names are normalised before the
+        matching (see `normalise_names`), enabling names that only differ in
+        whitespace, case, trailing authorship or sp./cf. qualifiers to share
+        a single request; the name column itself is kept as is
+    alternatives : None | str
+        if provided, the alternative matches considered by the GBIF API
+        (verbose request) are written to this csv/tsv, Parquet or Feather
+        file as a long format table: a row for each alternative match of
+        each row of the species list, with the api_terms and the row number
+        of the species list (rowNumber, the index for a DataFrame) as
+        foreign key; the species list itself does not contain the
+        alternatives
+    postprocess : None | function
+        if provided, function applied to the filled species list (or to each
+        chunk of it) before it is written, returning the table to write,
+        e.g. the synonym verification of the match_and_verify module
+    
+    Returns
+    -------
+    species_list_fill : pd.DataFrame | None
+        filled version of the tsv table; None when processed in chunks
+    """
+    match_options = {'strict': strict, 'cache': cache, 'workers': workers,
+                     'backbone': backbone, 'verbose': bool(alternatives)}
+    if shard is not None and not 0 <= shard < n_shards:
+        raise Exception('The shard should be in the range 0 to n_shards - 1')
+    if chunksize:
+        _extract_species_information_chunked(species_list_in, output,
+                                             update_cols, api_terms,
+                                             namecol, kingdomcol, chunksize,
+                                             resume, match_options, progress,
+                                             incremental, shard, n_shards,
+                                             normalise, alternatives,
+                                             postprocess)
+        return None
+    elif resume:
+        raise Exception('Resuming is only supported when processing in \
+                            chunks, provide a chunksize')
+
+    with _instrumented(progress):
+        species_list, delimiter = _read_species_list(species_list_in)
+        namecol, kingdomcol = _name_columns(species_list.columns, namecol,
+                                            kingdomcol)
+
+        # collect all API information, requesting each distinct name/kingdom
+        # combination only once
+        lookup_keys = _species_lookup_keys(species_list, namecol, kingdomcol,
+                                           normalise)
+        if shard is not None:
+            shard_rows = _shard_rows(lookup_keys, shard, n_shards)
+            species_list = _select_shard(species_list, shard_rows)
+            lookup_keys = list(compress(lookup_keys, shard_rows))
+        if progress is not None:
+            progress.add_total(rows=len(species_list))
+        rematch = None
+        if incremental:
+            hashes, rematch = _incremental_rows(species_list, lookup_keys,
+                                                api_terms)
+            if rematch is not None:
+                _report_incremental(rematch)
+                lookup_keys = list(compress(lookup_keys, rematch))
+            update_cols = update_cols or any(
+                column.startswith("gbifapi_") for column in species_list)
+        matched = match_species_names(dict.fromkeys(lookup_keys), **match_options)
+        _report_request_reuse(len(matched), len(lookup_keys), cache)
+        if alternatives:
+            alternatives_table = _alternatives_table(
+                _pop_alternatives(matched, api_terms), lookup_keys,
+                _row_numbers(species_list, rematch), api_terms)
+            _write_table(alternatives_table, alternatives, _delimiter(
+                alternatives))
+
+        species_list_fill = _fill_species_list(species_list, lookup_keys,
+                                               matched, api_terms,
+                                               update_cols, rematch)
+        if incremental:
+            species_list_fill[NAME_HASH_COLUMN] = hashes
+        if postprocess is not None:
+            species_list_fill = postprocess(species_list_fill)
+        if progress is not None:
+            progress.rows_processed(len(species_list_fill))
+
+        if output:
+            _write_table(species_list_fill, output, delimiter)
+    return species_list_fill
+
+def _read_checkpoint(checkpoint_file, expected):
+    """read the checkpoint of an interrupted run and verify that it belongs
+    to the same, unchanged, input file
+    """
+    with open(checkpoint_file) as checkpoint_handle:
+        checkpoint = json.load(checkpoint_handle)
+    for item in ['input', 'input_size', 'input_mtime']:
+        if checkpoint[item] != expected[item]:
+            raise Exception("".join(["Checkpoint ", checkpoint_file,
+                                     " does not correspond to the (unchanged)",
+                                     " input file, remove it to start over"]))
+    return checkpoint
+
+def _write_checkpoint(checkpoint_file, checkpoint):
+    """atomically (over)write the checkpoint file"""
+    with open(checkpoint_file + '.tmp', 'w') as checkpoint_handle:
+        json.dump(checkpoint, checkpoint_handle)
+    os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+def _extract_species_information_chunked(species_list_in, output,
+                                         update_cols, api_terms, namecol,
+                                         kingdomcol, chunksize, resume,
+                                         match_options, progress=None,
+                                         incremental=False, shard=None,
+                                         n_shards=1, normalise=False,
+                                         alternatives=None, postprocess=None):
+    """read, match and write the species list in chunks of chunksize rows,
+    see `extract_species_information`
+
+    The output is written to a temporary file next to the output file, which
+    replaces the output file when all chunks are done (enabling the output
+    file to be the same as the input file). After each chunk, the progress
+    is recorded in a checkpoint file, enabling to resume an interrupted run.
+    """
+    if not isinstance(species_list_in, str) or not output:
+        raise Exception('Processing in chunks requires a filename for both \
+                            the input and the output')
+    if any(_file_format(filename) != 'csv' for filename in
+           [species_list_in, output, alternatives] if filename):
+        raise Exception('Processing in chunks is only supported for csv/tsv \
+                            files')
+    # the columns of 'all' terms depend on the messages of each chunk, while
+    # the header is written with the first chunk only
+    if 'all' in api_terms:
+        raise Exception("Processing in chunks requires the api_terms to be \
+                            listed explicitly, 'all' is not supported")
+
+    delimiter = _delimiter(species_list_in)
+    output_tmp = output + '.tmp'
+    checkpoint_file = output + '.checkpoint'
+    input_stat = os.stat(species_list_in)
+    checkpoint = {'input': os.path.abspath(species_list_in),
+                  'input_size': input_stat.st_size,
+                  'input_mtime': input_stat.st_mtime,
+                  'rows': 0, 'bytes': 0, 'alternatives_bytes': 0}
+    if alternatives:
+        alternatives_tmp = alternatives + '.tmp'
+
+    if resume and os.path.exists(checkpoint_file):
+        checkpoint = _read_checkpoint(checkpoint_file, checkpoint)
+        # drop any partially written chunk after the last checkpoint
+        with open(output_tmp, 'r+b') as tmp:
+            tmp.truncate(checkpoint['bytes'])
+        if alternatives:
+            with open(alternatives_tmp, 'r+b') as tmp:
+                tmp.truncate(checkpoint.get('alternatives_bytes', 0))
+        print(''.join(['Resuming after ', str(checkpoint['rows']),
+                       ' rows.']))
+    elif resume:
+        print('No checkpoint found, starting from the first row.')
+
+    n_rows = checkpoint['rows']
+    reader = pd.read_csv(species_list_in, sep=delimiter, encoding='utf-8',
+                         dtype=object, chunksize=chunksize,
+                         skiprows=range(1, n_rows + 1))
+
+    # reuse the matches of the previous chunks (the most recently used ones,
+    # see MAX_REUSED_MATCHES)
+    matched = OrderedDict()
+    alternatives_matched = {}
+    n_match_rows = n_requested = 0
+    first_chunk = True
+    try:
+        with _instrumented(progress):
+            for species_list in reader:
+                n_chunk_rows = len(species_list)
+                if first_chunk:
+                    namecol, kingdomcol = _name_columns(species_list.columns,
+                                                        namecol, kingdomcol)
+                lookup_keys = _species_lookup_keys(species_list, namecol,
+                                                   kingdomcol, normalise)
+                if shard is not None:
+                    shard_rows = _shard_rows(lookup_keys, shard, n_shards)
+                    species_list = _select_shard(species_list, shard_rows,
+                                                 n_rows)
+                    lookup_keys = list(compress(lookup_keys, shard_rows))
+                if progress is not None:
+                    progress.add_total(rows=len(species_list))
+                rematch = None
+                chunk_update_cols = update_cols
+                if incremental:
+                    hashes, rematch = _incremental_rows(species_list,
+                                                        lookup_keys, api_terms)
+                    if rematch is not None:
+                        _report_incremental(rematch)
+                        lookup_keys = list(compress(lookup_keys, rematch))
+                    chunk_update_cols = update_cols or any(
+                        column.startswith("gbifapi_")
+                        for column in species_list)
+                n_match_rows += len(lookup_keys)
+                new_keys = [lookup_key for lookup_key
+                            in dict.fromkeys(lookup_keys)
+                            if lookup_key not in matched]
+                new_matched = match_species_names(new_keys, **match_options)
+                n_requested += len(new_keys)
+                if alternatives:
+                    alternatives_matched.update(
+                        _pop_alternatives(new_matched, api_terms))
+                    _alternatives_table(
+                        alternatives_matched, lookup_keys,
+                        _row_numbers(species_list, rematch, n_rows),
+                        api_terms).to_csv(alternatives_tmp,
+                                          sep=_delimiter(alternatives),
+                                          index=False, encoding='utf-8',
+                                          mode='w' if n_rows == 0 else 'a',
+                                          header=n_rows == 0)
+                matched.update(_slim_messages(new_matched, api_terms))
+
+                species_list_fill = _fill_species_list(species_list,
+                                                       lookup_keys, matched,
+                                                       api_terms,
+                                                       chunk_update_cols,
+                                                       rematch)
+                if incremental:
+                    species_list_fill[NAME_HASH_COLUMN] = hashes
+                if postprocess is not None:
+                    species_list_fill = postprocess(species_list_fill)
+                species_list_fill.to_csv(output_tmp, sep=delimiter,
+                                         index=False, encoding='utf-8',
+                                         mode='w' if n_rows == 0 else 'a',
+                                         header=n_rows == 0)
+                _evict_matches(matched, lookup_keys, alternatives_matched)
+                n_rows += n_chunk_rows
+                first_chunk = False
+                if progress is not None:
+                    progress.rows_processed(len(species_list))
+
+                checkpoint['rows'] = n_rows
+                checkpoint['bytes'] = os.path.getsize(output_tmp)
+                if alternatives:
+                    checkpoint['alternatives_bytes'] = \
+                        os.path.getsize(alternatives_tmp)
+                _write_checkpoint(checkpoint_file, checkpoint)
+                print(''.join(['Processed ', str(n_rows), ' rows.']))
+    finally:
+        reader.close()
+    os.replace(output_tmp, output)
+    if alternatives:
+        os.replace(alternatives_tmp, alternatives)
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    _report_request_reuse(n_requested, n_match_rows, match_options['cache'])
+
+def _match_batches(items, name_kingdom, api_terms, match_options,
+                   batchsize=1000, progress=None, normalise=False):
+    """match the items in batches of batchsize items, requesting each
+    distinct name/kingdom combination only once (also across the batches)
+
+    Parameters
+    ----------
+    items : iterable
+        items to match, e.g. the rows of a csv file
+    name_kingdom : function
+        function returning the name and kingdom of an item
+
+    Yields
+    ------
+    batch : list
+        the items of the batch
+    lookup_keys : list of (str, str) tuples
+        name/kingdom pair of each item of the batch
+    matched : dict
+        message (limited to the api_terms) of the name/kingdom pairs of the
+        batch and of the (MAX_REUSED_MATCHES) most recently used pairs of the
+        previous batches
+    n_new : int
+        number of name/kingdom pairs requested for the batch
+    """
+    items = iter(items)
+    matched = OrderedDict()
+    while True:
+        batch = list(islice(items, batchsize))
+        if not batch:
+            return
+        if progress is not None:
+            progress.add_total(rows=len(batch))
+        lookup_keys = [_lookup_key(*name_kingdom(item)) for item in batch]
+        if normalise:
+            lookup_keys = [(normalise_name(name, normalise),
+                            normalise_name(kingdom, ["whitespace", "case"]))
+                           for name, kingdom in lookup_keys]
+        new_keys = [lookup_key for lookup_key in dict.fromkeys(lookup_keys)
+                    if lookup_key not in matched]
+        new_matched = match_species_names(new_keys, **match_options)
+        _api_terms_to_extract(api_terms, list(new_matched.values()))
+        matched.update(_slim_messages(new_matched, api_terms))
+        if progress is not None:
+            progress.rows_processed(len(batch))
+        yield batch, lookup_keys, matched, len(new_keys)
+        _evict_matches(matched, lookup_keys)
+
+def _name_kingdom(item):
+    """name and kingdom of a (name, kingdom) pair or of a single name"""
+    if isinstance(item, str) or _is_missing(item):
+        return item, None
+    return item
+
+def iter_species_information(species_names,
+                             api_terms=["usageKey",
+                                        "scientificName",
+                                        "canonicalName",
+                                        "status",
+                                        "rank",
+                                        "matchType",
+                                        "confidence"],
+                             namecol="scientificName",
+                             kingdomcol="kingdom",
+                             strict=True,
+                             cache=None,
+                             workers=1,
+                             backbone=None,
+                             progress=None,
+                             batchsize=1000,
+                             as_dataframe=False,
+                             normalise=False):
+    """match a stream of species names and yield the enriched records as
+    soon as each batch of names is matched, e.g. to load them into a
+    database while the matching is still in progress
+
+    Parameters
+    ----------
+    species_names : iterable of (str, str) tuples | iterable of str
+        species name and kingdom pairs (or only species names), e.g. a
+        generator reading the names from a database query
+    api_terms : list | 'all'
+        the terms from the API to add to the records
+    namecol : str
+        key (column name) of the species name in the records
+    kingdomcol : str
+        key (column name) of the kingdom in the records
+    strict, cache, workers, backbone, progress, normalise :
+        see `extract_species_information`
+    batchsize : int
+        number of names matched at once; smaller batches yield the first
+        records sooner, larger batches share more requests
+    as_dataframe : boolean
+        if True, a pd.DataFrame is yielded for each batch (with typed
+        gbifapi_* columns, see `extract_species_information`), otherwise a
+        dictionary for each name
+
+    Yields
+    ------
+    record : dict | pd.DataFrame
+        name, kingdom and the api_terms of the GBIF API as gbifapi_*, in the
+        order of species_names
+
+    Example
+    -------
+    for record in iter_species_information([('Alopochen aegyptiaca',
+                                             'Animalia')]):
+        print(record['gbifapi_usageKey'])
+    """
+    match_options = {'strict': strict, 'cache': cache, 'workers': workers,
+                     'backbone': backbone}
+    n_rows = 0
+    with _instrumented(progress):
+        for batch, lookup_keys, matched, _ in _match_batches(
+                species_names, _name_kingdom, api_terms, match_options,
+                batchsize, progress, normalise):
+            names = [_name_kingdom(item) for item in batch]
+            if as_dataframe:
+                index = pd.RangeIndex(n_rows, n_rows + len(batch))
+                records = pd.DataFrame(names, columns=[namecol, kingdomcol],
+                                       index=index, dtype=object)
+                yield pd.concat([records,
+                                 _api_columns(lookup_keys, matched, api_terms,
+                                              index)], axis=1)
+            else:
+                terms = _api_terms_to_extract(
+                    api_terms, [matched[lookup_key]
+                                for lookup_key in dict.fromkeys(lookup_keys)])
+                for (name, kingdom), lookup_key in zip(names, lookup_keys):
+                    record = {namecol: name, kingdomcol: kingdom}
+                    message = matched[lookup_key]
+                    for term in terms:
+                        record["".join(["gbifapi_", term])] = message.get(term)
+                    yield record
+            n_rows += len(batch)
+
+def _lean_supported(species_list_in, output, api_terms, **options):
+    """check if a run can use the lean, pandas-free, path: csv/tsv (or
+    '-' for stdin/stdout) input and output, matching by the GBIF API and
+    none of the options requiring the DataFrame path
+    """
+    if not isinstance(species_list_in, str) or not output:
+        return False
+    for filename in [species_list_in, output]:
+        if filename != '-' and _file_format(filename) != 'csv':
+            return False
+    return 'all' not in api_terms and not any(options.values())
+
+def _extract_species_information_lean(species_list_in, output, update_cols,
+                                      api_terms, namecol, kingdomcol,
+                                      match_options, progress=None,
+                                      batchsize=1000, stdout=None,
+                                      normalise=False):
+    """stream the rows of a csv/tsv file through the matching and write the
+    enriched rows, using the standard library only (no pandas); '-' reads
+    from stdin or writes to stdout
+
+    The rows are matched in batches of batchsize rows, requesting each
+    distinct name/kingdom combination only once. The values of the input
+    file are written as read, skipping blank lines. The output is written to
+    a temporary file, replacing the output file when done (enabling the
+    output file to be the same as the input file).
+    """
+    stdout = stdout or sys.stdout
+    with _instrumented(progress):
+        if species_list_in == '-':
+            in_handle = sys.stdin
+        else:
+            in_handle = open(species_list_in, newline='', encoding='utf-8')
+        try:
+            header_line = in_handle.readline()
+            if species_list_in == '-':
+                # stdin: tab separated when the header contains tabs only
+                delimiter = '\t' if '\t' in header_line and \
+                    ',' not in header_line else ','
+            else:
+                delimiter = _delimiter(species_list_in)
+            header = next(csv.reader([header_line], delimiter=delimiter))
+            namecol, kingdomcol = _name_columns(header, namecol, kingdomcol)
+
+            # output columns, as by `_fill_species_list`
+            terms = list(dict.fromkeys(list(api_terms) +
+                                       ["acceptedKey", "acceptedScientificName"]))
+            api_columns = ["".join(["gbifapi_", term]) for term in terms]
+            if update_cols:
+                for column in api_columns:
+                    if column not in header and column not in [
+                            "gbifapi_acceptedKey",
+                            "gbifapi_acceptedScientificName"]:
+                        raise Exception("".join(["Update not possible, column ",
+                                                 column, " not yet part of the ",
+                                                 "dataframe"]))
+                out_header = header + [column for column in api_columns
+                                       if column not in header]
+            else:
+                if sum(column.startswith("gbifapi_") for column in header) == \
+                        len(api_columns):
+                    raise Exception("""The gbifAPI terms are already enlisted in the 
+                                    species list, consider update_cols for updating 
+                                    the columns
+                                    """)
+                out_header = header + api_columns
+            positions = {column: out_header.index(column)
+                         for column in api_columns}
+            name_idx = header.index(namecol)
+            kingdom_idx = header.index(kingdomcol) if kingdomcol else None
+
+            if output == '-':
+                out_handle = stdout
+            else:
+                output_tmp = output + '.tmp'
+                out_handle = open(output_tmp, 'w', newline='',
+                                  encoding='utf-8')
+            try:
+                writer = csv.writer(out_handle, delimiter=delimiter,
+                                    lineterminator='\n')
+                writer.writerow(out_header)
+                # skip blank lines and pad short rows to the header, as
+                # pandas does
+                reader = (row + [''] * (len(header) - len(row))
+                          for row in csv.reader(in_handle, delimiter=delimiter)
+                          if row)
+                n_rows = n_unique = 0
+                for rows, lookup_keys, matched, n_new in _match_batches(
+                        reader, lambda row: (row[name_idx] or None,
+                                             row[kingdom_idx] or None
+                                             if kingdom_idx is not None
+                                             else None),
+                        api_terms, match_options, batchsize, progress,
+                        normalise):
+                    n_unique += n_new
+                    for row, lookup_key in zip(rows, lookup_keys):
+                        message = matched[lookup_key]
+                        row = row + [''] * (len(out_header) - len(row))
+                        for term, column in zip(terms, api_columns):
+                            value = message.get(term)
+                            row[positions[column]] = '' if value is None \
+                                else str(value)
+                        writer.writerow(row)
+                    n_rows += len(rows)
+            finally:
+                if output != '-':
+                    out_handle.close()
+        finally:
+            if species_list_in != '-':
+                in_handle.close()
+    if output != '-':
+        os.replace(output_tmp, output)
+    _report_request_reuse(n_unique, n_rows, match_options['cache'])
 
 def main(argv=None):
     """
     Request species name information to the GBIF API and concatenate the 
     information to an existing data table
     """    
+    global MAX_REQUESTS_PER_SECOND, GBIF_API_URL
+
     parser = argparse.ArgumentParser(description="""Request species name 
         information to the GBIF API and concatenate the information to an 
         existing data table.
         """)    
     
     parser.add_argument('inputfile', type=str,
-                        help='the relative path and filename containing the species to request the info')
+                        help='the relative path and filename containing the species to request the info (csv, tsv, parquet or feather)')
                        
     parser.add_argument('outputfile', action='store', default=None, 
                         help='output file name, can be same as input')
@@ -349,19 +1742,185 @@ def main(argv=None):
                             """
                         )
 
+    parser.add_argument('--cache', type=str,
+                        action='store', default=None,
+                        help='SQLite file to cache the GBIF API responses between runs; if None, no cache is used (default: None)')
+
+    parser.add_argument('--cache_ttl', type=float,
+                        action='store', default=30,
+                        help='number of days a cached response remains valid (default: 30)')
+
+    parser.add_argument('--cache_max_entries', type=int,
+                        action='store', default=1000000,
+                        help='maximum number of responses in the cache, the least recently used responses are removed first (default: 1000000)')
+
+    parser.add_argument('--refresh_cache', dest='refresh_cache',
+                        action='store_true', default=False,
+                        help='bypass the cached responses and request all names again, updating the cache (False when not selected)')
+
+    parser.add_argument('--workers', type=int,
+                        action='store', default=1,
+                        help='number of names requested concurrently to the GBIF API (default: 1)')
+
+    parser.add_argument('--max_rate', type=float,
+                        action='store', default=None,
+                        help='maximum number of requests per second to the GBIF API; if None, the rate is not limited (default: None)')
+
+    parser.add_argument('--chunksize', type=int,
+                        action='store', default=None,
+                        help='number of rows to read, match and write at once, keeping the memory use constant for large files; if None, the entire file is handled at once (default: None)')
+
+    parser.add_argument('--resume', dest='resume',
+                        action='store_true', default=False,
+                        help='continue an interrupted run, skipping the rows already written according to the checkpoint file (requires --chunksize, False when not selected)')
+
+    parser.add_argument('--incremental', dest='incremental',
+                        action='store_true', default=False,
+                        help='only (re)match new and edited rows and rows without a match, based on the name hash stored in the gbifapi_nameHash column by a previous incremental run (False when not selected)')
+
+    parser.add_argument('--shards', type=int,
+                        action='store', default=1,
+                        help='number of shards to divide the rows in, based on a hash of the name and kingdom (default: 1)')
+
+    parser.add_argument('--shard', type=int,
+                        action='store', default=None,
+                        help='only process the rows of this shard (0 to shards - 1), e.g. on a separate core or host, adding their row number in the shard_rowNumber column; if None, all rows are processed (default: None)')
+
+    parser.add_argument('--merge_shards', dest='merge_shards',
+                        action='store_true', default=False,
+                        help='merge the output files of the shards matching the inputfile pattern (e.g. "out.shard-*.tsv") into the outputfile in the original row order, instead of matching (False when not selected)')
+
+    parser.add_argument('--normalise', type=str, nargs='*',
+                        choices=list(NORMALISATION_STEPS),
+                        action='store', default=None,
+                        help='normalise the names before the matching, using the given steps or all of them (whitespace qualifiers authorship case) when none are given; the name column is kept as is (default: None)')
+
+    parser.add_argument('--alternatives', type=str,
+                        action='store', default=None,
+                        help='file to write the alternative matches considered by the GBIF API to, as a separate table with a row for each alternative of each row (rowNumber column); if None, the alternatives are not requested (default: None)')
+
+    parser.add_argument('--backend', type=str,
+                        choices=['api', 'offline', 'fuzzy'],
+                        action='store', default='api',
+                        help='match the names by requests to the GBIF API, offline against a local backbone index (see --backbone) or fuzzy against a reference list (see --reference) (default: api)')
+
+    parser.add_argument('--backbone', type=str,
+                        action='store', default=None,
+                        help='SQLite file with the local backbone index used by the offline backend, as created by gbif_backbone_index.py (default: None)')
+
+    parser.add_argument('--reference', type=str,
+                        action='store', default=None,
+                        help='csv/tsv file with the reference list of names (column scientificName) used by the fuzzy backend (default: None)')
+
+    parser.add_argument('--api_url', type=str,
+                        action='store', default=GBIF_API_URL,
+                        help='base URL of the GBIF API, e.g. to use a local stand-in of the API (default: {})'.format(GBIF_API_URL))
+
+    parser.add_argument('--progress', type=str, choices=['bar', 'json'],
+                        action='store', default=None,
+                        help='report the progress, request timing and cache use as a progress bar or as JSON lines on stderr (default: None)')
+
+    parser.add_argument('--progress_interval', type=float,
+                        action='store', default=10,
+                        help='seconds between two JSON progress lines (default: 10)')
+
     args = parser.parse_args()
+
+    # without DataFrame input or output, stream the rows without pandas
+    lean = not args.merge_shards and _lean_supported(
+        args.inputfile, args.outputfile, args.api_terms,
+        chunksize=args.chunksize, resume=args.resume,
+        incremental=args.incremental, shard=args.shard is not None,
+        backbone=args.backend != 'api', alternatives=args.alternatives)
+    if '-' in [args.inputfile, args.outputfile] and not lean:
+        parser.error('stdin/stdout (-) is only supported for csv/tsv data '
+                     'matched by the GBIF API, without --api_terms all, '
+                     '--chunksize, --resume, --incremental, --shard and '
+                     '--alternatives')
+    stdout = sys.stdout
+    if args.outputfile == '-':
+        # keep the messages out of the output rows
+        sys.stdout = sys.stderr
+
     print(args)    
     print(args.inputfile)    
     
+    if args.merge_shards:
+        print("Merging the shards...")
+        merge_shards(args.inputfile, args.outputfile)
+        print("saving to file...done!")
+        return
+
+    MAX_REQUESTS_PER_SECOND = args.max_rate
+    GBIF_API_URL = args.api_url.rstrip('/') + '/'
+
+    if args.backend == 'offline':
+        if not args.backbone:
+            parser.error('the offline backend requires a --backbone index file')
+        from gbif_backbone_index import BackboneIndex
+        backbone = BackboneIndex(args.backbone)
+    elif args.backend == 'fuzzy':
+        if not args.reference:
+            parser.error('the fuzzy backend requires a --reference file')
+        from fuzzy_name_index import FuzzyNameIndex
+        backbone = FuzzyNameIndex(args.reference)
+    else:
+        backbone = None
+
+    if args.cache:
+        cache = ResponseCache(args.cache, ttl=args.cache_ttl * 24 * 3600,
+                              max_entries=args.cache_max_entries,
+                              refresh=args.refresh_cache)
+    else:
+        cache = None
+
+    if args.progress:
+        progress = MatchProgress(mode=args.progress,
+                                 interval=args.progress_interval)
+    else:
+        progress = None
+
+    # --normalise without steps applies all of them
+    normalise = args.normalise or args.normalise == []
+
     print("Working on the requests...")
-    extract_species_information(args.inputfile, args.outputfile,
-                                api_terms=args.api_terms,
-                                update_cols=args.update,                                 
-                                namecol=args.namecol, 
-                                kingdomcol=args.kingdomcol,
-                                strict=args.strict
-                                ) 
-    print("saving to file...done!")
+    try:
+        if lean:
+            _extract_species_information_lean(args.inputfile, args.outputfile,
+                                              args.update, args.api_terms,
+                                              args.namecol, args.kingdomcol,
+                                              {'strict': args.strict,
+                                               'cache': cache,
+                                               'workers': args.workers},
+                                              progress, stdout=stdout,
+                                              normalise=normalise)
+        else:
+            extract_species_information(args.inputfile, args.outputfile,
+                                        api_terms=args.api_terms,
+                                        update_cols=args.update,
+                                        namecol=args.namecol,
+                                        kingdomcol=args.kingdomcol,
+                                        strict=args.strict,
+                                        cache=cache,
+                                        workers=args.workers,
+                                        chunksize=args.chunksize,
+                                        resume=args.resume,
+                                        backbone=backbone,
+                                        progress=progress,
+                                        incremental=args.incremental,
+                                        shard=args.shard,
+                                        n_shards=args.shards,
+                                        normalise=normalise,
+                                        alternatives=args.alternatives
+                                        )
+    finally:
+        if cache is not None:
+            cache.close()
+        if backbone is not None:
+            backbone.close()
+        sys.stdout = stdout
+    print("saving to file...done!", file=sys.stderr
+          if args.outputfile == '-' else sys.stdout)
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio version of the GBIF species name matching, using aiohttp for the
+non-blocking requests to the GBIF API
+
+created within the scope of Lifewatch - INBO
+"""
+
+import time
+import asyncio
+
+import aiohttp
+
+import gbif_species_name_match as gsnm
+
+
+async def _request_json_async(session, request, semaphore, cache=None,
+                              progress=None):
+    """get the json message of an API request, using the cache when
+    provided (caching only successful responses); retries and rate limits
+    as `gbif_species_name_match._get`
+
+    The (blocking) SQLite cache is accessed in a worker thread, keeping the
+    event loop free.
+    """
+    if cache is not None:
+        message = await asyncio.to_thread(cache.get, request)
+        if progress is not None:
+            progress.cache_lookup(message is not None)
+        if message is not None:
+            return message
+
+    async with semaphore:
+        if progress is None:
+            message, ok, _ = await _get_json_with_retries(session, request)
+        else:
+            progress.request_started()
+            started = time.monotonic()
+            retries = 0
+            try:
+                message, ok, retries = await _get_json_with_retries(
+                    session, request)
+            finally:
+                progress.request_finished(gsnm._endpoint(request),
+                                          time.monotonic() - started,
+                                          retries)
+
+    if cache is not None and ok:
+        await asyncio.to_thread(cache.set, request, message)
+    return message
+
+
+async def _get_json_with_retries(session, request):
+    """GET request with retries, returning the json message, whether the
+    response was successful and the number of retries
+    """
+    for attempt in range(gsnm.MAX_RETRIES + 1):
+        delay = gsnm._rate_limiter.reserve(gsnm.MAX_REQUESTS_PER_SECOND)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            async with session.get(request) as response:
+                if response.status not in gsnm.RETRY_STATUS_CODES:
+                    return await response.json(content_type=None), \
+                        response.ok, attempt
+                if attempt == gsnm.MAX_RETRIES:
+                    response.raise_for_status()
+                wait = gsnm._retry_wait(attempt, response.status,
+                                        response.headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == gsnm.MAX_RETRIES:
+                raise
+            wait = gsnm._retry_wait(attempt)
+        await asyncio.sleep(wait)
+
+
+async def match_species_name_async(session, species_name, kingdom=None,
+                                   strict=True, cache=None, semaphore=None,
+                                   progress=None):
+    """request the GBIF match for a single name, see
+    `gbif_species_name_match.match_species_name`
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        HTTP session used for the requests
+    species_name : str
+        species name, preferably the Gbif proposed name
+    kingdom : str
+        kingdom of the species
+    strict : boolean
+        add strict option to the api request as True or False
+    cache : None | ResponseCache
+        persistent cache of the API responses
+    semaphore : None | asyncio.Semaphore
+        limits the number of concurrent requests
+    progress : None | MatchProgress
+        collects the progress and timing of the requests
+
+    Returns
+    -------
+    message : dict
+        API response including acceptedKey and acceptedScientificName or,
+        when no match is found, only the matchType
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+
+    species_info = await _match_species_name_only_async(
+        session, species_name, kingdom, strict, cache, semaphore, progress)
+    # add extra item with acceptedKey
+    await add_accepted_keys_async(session, [species_info], cache, semaphore,
+                                  progress)
+    return species_info
+
+
+async def add_accepted_keys_async(session, messages, cache=None,
+                                  semaphore=None, progress=None):
+    """add the acceptedKey and acceptedScientificName to a collection of
+    matched messages, requesting the accepted name of each distinct synonym
+    usageKey only once, see `gbif_species_name_match.add_accepted_keys`
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+
+    synonyms = []
+    for message in messages:
+        if 'status' not in message:
+            continue
+        if gsnm._is_synonym(message):
+            synonyms.append(message)
+        else:
+            gsnm._set_accepted_key(message, message['usageKey'],
+                                   message['scientificName'])
+
+    usage_keys = list(dict.fromkeys(message['usageKey']
+                                    for message in synonyms))
+    responses = await asyncio.gather(
+        *[_request_json_async(session, gsnm._accepted_key_request(usage_key),
+                              semaphore, cache, progress)
+          for usage_key in usage_keys])
+    accepted = {usage_key: gsnm._parse_accepted_key(response)
+                for usage_key, response in zip(usage_keys, responses)}
+    for message in synonyms:
+        gsnm._set_accepted_key(message, *accepted[message['usageKey']])
+    return accepted
+
+
+async def _match_species_name_only_async(session, species_name, kingdom,
+                                         strict, cache, semaphore,
+                                         progress=None):
+    """request the GBIF match for a single name, without the accepted name
+    """
+    request = gsnm._species_match_request(species_name, kingdom, strict)
+    if request:
+        species_info = await _request_json_async(session, request,
+                                                 semaphore, cache, progress)
+    else:
+        species_info = None
+    if progress is not None:
+        progress.names_matched()
+    if gsnm._is_match(species_info):
+        return species_info
+    else:
+        return gsnm._no_match_message(species_info)
+
+
+async def extract_species_information_async(species_list_in,
+                                            output=None,
+                                            update_cols=False,
+                                            api_terms=["usageKey",
+                                                       "scientificName",
+                                                       "canonicalName",
+                                                       "status",
+                                                       "rank",
+                                                       "matchType",
+                                                       "confidence"],
+                                            namecol=None,
+                                            kingdomcol=None,
+                                            strict=True,
+                                            cache=None,
+                                            concurrency=10,
+                                            session=None,
+                                            progress=None,
+                                            normalise=False
+                                            ):
+    """read tsv, request the information from GBIF and add the required
+    information from the mapping, without blocking the event loop
+
+    The arguments and the returned DataFrame are the same as for
+    `gbif_species_name_match.extract_species_information`, except for:
+
+    Parameters
+    ----------
+    concurrency : int
+        maximum number of concurrent requests to the GBIF API; the overall
+        request rate is limited by MAX_REQUESTS_PER_SECOND of the
+        gbif_species_name_match module
+    session : None | aiohttp.ClientSession
+        HTTP session to use for the requests; if None, a session is created
+        (and closed) for this call
+    """
+    # the progress is passed down explicitly (instead of activated module
+    # wide), so concurrent calls can each report to their own progress
+    if progress is not None:
+        progress.start()
+    try:
+        return await _extract_species_information_async(
+            species_list_in, output, update_cols, api_terms, namecol,
+            kingdomcol, strict, cache, concurrency, session, progress,
+            normalise)
+    finally:
+        if progress is not None:
+            progress.finish()
+
+
+async def _extract_species_information_async(species_list_in, output,
+                                             update_cols, api_terms, namecol,
+                                             kingdomcol, strict, cache,
+                                             concurrency, session, progress,
+                                             normalise):
+    """see `extract_species_information_async`"""
+    species_list, delimiter = await asyncio.to_thread(
+        gsnm._read_species_list, species_list_in)
+    namecol, kingdomcol = gsnm._name_columns(species_list.columns, namecol,
+                                             kingdomcol)
+
+    # collect all API information, requesting each distinct name/kingdom
+    # combination only once
+    lookup_keys = gsnm._species_lookup_keys(species_list, namecol,
+                                            kingdomcol, normalise)
+    unique_keys = list(dict.fromkeys(lookup_keys))
+    if progress is not None:
+        progress.add_total(rows=len(lookup_keys), names=len(unique_keys))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=gsnm.TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=concurrency))
+    try:
+        # match the names first, followed by the accepted names of the
+        # distinct synonyms
+        messages = await asyncio.gather(
+            *[_match_species_name_only_async(session, *lookup_key, strict,
+                                             cache, semaphore, progress)
+              for lookup_key in unique_keys])
+        await add_accepted_keys_async(session, messages, cache, semaphore,
+                                      progress)
+    finally:
+        if own_session:
+            await session.close()
+
+    matched = dict(zip(unique_keys, messages))
+    gsnm._report_request_reuse(len(matched), len(lookup_keys), cache)
+
+    species_list_fill = gsnm._fill_species_list(species_list, lookup_keys,
+                                                matched, api_terms,
+                                                update_cols)
+    if progress is not None:
+        progress.rows_processed(len(species_list_fill))
+
+    if output:
+        await asyncio.to_thread(gsnm._write_table, species_list_fill, output,
+                                delimiter)
+    return species_list_fill
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Single pass matching of the species names and verification of the matched
+synonyms, writing the output file only once
+
+created within the scope of Lifewatch - INBO
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "verify_synonyms"))
+
+import gbif_species_name_match as gsnm
+from gbif_species_name_match import extract_species_information
+from verify_synonyms import (SynonymList, _verify_table,
+                             _verification_counts, _add_counts)
+from response_cache import ResponseCache
+
+
+def match_and_verify(species_list_in, output=None, synonym_file=None,
+                     synonym_store=None, outputcol='nameMatchValidation',
+                     api_terms=["usageKey",
+                                "scientificName",
+                                "canonicalName",
+                                "status",
+                                "rank",
+                                "matchType",
+                                "confidence"],
+                     **options):
+    """match the names of the species list with the GBIF API (see
+    `extract_species_information`) and verify the matched synonyms against
+    the synonym file (see `verify_synonym`) in memory, for the whole species
+    list or, when processing in chunks, for each chunk, before writing the
+    output file once
+
+    Parameters
+    ----------
+    species_list_in : str | pd.DataFrame
+        species list as file (csv, tsv, Parquet or Feather) or DataFrame
+    output : None | str
+        file to write the matched and verified species list to
+    synonym_file : None | str
+        synonym file with the gbifapi_usageKey, gbifapi_acceptedKey and status
+        columns (tsv, Parquet or Feather)
+    synonym_store : None | str
+        if provided, the synonyms are looked up in this SQLite store, (re)built
+        from the synonym_file when missing or outdated
+    outputcol : str
+        column name to put the status of the verification
+    api_terms : list | 'all'
+        the terms from the API to add; usageKey and status are always added,
+        as required for the verification
+    options :
+        other arguments of `extract_species_information`, e.g. workers,
+        cache or chunksize
+
+    Returns
+    -------
+    species_list_fill : pd.DataFrame | None
+        matched and verified species list; None when processed in chunks
+    """
+    if not synonym_file and not synonym_store:
+        raise Exception('Provide a synonym_file or synonym_store for the \
+                            verification')
+    if 'all' not in api_terms:
+        api_terms = list(dict.fromkeys(list(api_terms) +
+                                       ["usageKey", "status"]))
+
+    if synonym_store:
+        from synonym_store import SynonymStore
+        synonyms = SynonymStore(synonym_store, synonym_file)
+    else:
+        synonyms = SynonymList(synonym_file)
+    columns = ("gbifapi_usageKey", "gbifapi_acceptedKey", "gbifapi_status",
+               outputcol)
+    counts = {}
+
+    def _verify(species_list_fill):
+        verified = _verify_table(species_list_fill, synonyms, *columns)
+        _add_counts(counts, _verification_counts(verified, *columns[2:]))
+        return verified
+
+    try:
+        species_list_fill = extract_species_information(
+            species_list_in, output, api_terms=api_terms, postprocess=_verify,
+            **options)
+    finally:
+        if synonym_store:
+            synonyms.close()
+    print(''.join(['Verified ', str(counts.get('synonyms', 0)),
+                   ' matched synonyms: ',
+                   ', '.join(''.join([str(status), ' ', str(count)])
+                             for status, count in counts.items()
+                             if status not in ['rows', 'synonyms']), '.']))
+    return species_list_fill
+
+
+def main(argv=None):
+    """
+    Match the species names with the GBIF API and verify the matched
+    synonyms in a single pass
+    """
+    parser = argparse.ArgumentParser(description="""Request the usageKey and
+        related information from the GBIF API and verify the matched
+        synonyms against a synonym list, writing the output file only once
+        (combining gbif_species_name_match.py and verify_synonyms.py).
+        """)
+
+    parser.add_argument('inputfile', type=str,
+                        help='the relative path and filename containing the species to request the info (csv, tsv, parquet or feather)')
+
+    parser.add_argument('outputfile', action='store', default=None,
+                        help='output file name, can be same as input')
+
+    parser.add_argument('--synonym_file', type=str,
+                        action='store', default=None,
+                        help='relative path and filename to the file containing the synonym status information')
+
+    parser.add_argument('--synonym_store', type=str,
+                        action='store', default=None,
+                        help='SQLite file with the indexed store of the synonym file, (re)built from the synonym file when missing or when the synonym file changed (default: None)')
+
+    parser.add_argument('--outputcol', type=str,
+                        action='store', default='nameMatchValidation',
+                        help='column name of the output file to provide the information about the synonym status (default: nameMatchValidation)')
+
+    parser.add_argument('--update', dest='update',
+                        action='store_true', default=False,
+                        help='the columns are updated instead of added (False when not selected)')
+
+    parser.add_argument('--namecol', type=str,
+                        action='store', default=None,
+                        help='column header from which to read the scientific name; if None, an automatic derivation is attempted (default: None)')
+
+    parser.add_argument('--kingdomcol', type=str,
+                        action='store', default=None,
+                        help='column header from which to read the kingdom; if None, an automatic derivation is attempted (default: None)')
+
+    parser.add_argument('--strict', dest='strict', action='store_true',
+                        default=False, help='Perform the GBIF API strict (False when not selected)')
+
+    parser.add_argument('--api_terms', type=str, nargs='+',
+                        action='store', default=["usageKey",
+                                                 "scientificName",
+                                                 "canonicalName",
+                                                 "status",
+                                                 "rank",
+                                                 "matchType",
+                                                 "confidence"],
+                        help="""specify the names to extract from the GBIF API
+                            request, default: usageKey scientificName
+                            canonicalName status rank matchType confidence. If
+                            all, the entire message is taken into columns
+                            """)
+
+    parser.add_argument('--cache', type=str,
+                        action='store', default=None,
+                        help='SQLite file to cache the GBIF API responses between runs; if None, no cache is used (default: None)')
+
+    parser.add_argument('--cache_ttl', type=float,
+                        action='store', default=30,
+                        help='number of days a cached response remains valid (default: 30)')
+
+    parser.add_argument('--cache_max_entries', type=int,
+                        action='store', default=1000000,
+                        help='maximum number of responses in the cache, the least recently used responses are removed first (default: 1000000)')
+
+    parser.add_argument('--refresh_cache', dest='refresh_cache',
+                        action='store_true', default=False,
+                        help='bypass the cached responses and request all names again, updating the cache (False when not selected)')
+
+    parser.add_argument('--workers', type=int,
+                        action='store', default=1,
+                        help='number of names requested concurrently to the GBIF API (default: 1)')
+
+    parser.add_argument('--max_rate', type=float,
+                        action='store', default=None,
+                        help='maximum number of requests per second to the GBIF API; if None, the rate is not limited (default: None)')
+
+    parser.add_argument('--chunksize', type=int,
+                        action='store', default=None,
+                        help='number of rows to read, match, verify and write at once, keeping the memory use constant for large files; if None, the entire file is handled at once (default: None)')
+
+    parser.add_argument('--api_url', type=str,
+                        action='store', default=gsnm.GBIF_API_URL,
+                        help='base URL of the GBIF API, e.g. to use a local stand-in of the API (default: {})'.format(gsnm.GBIF_API_URL))
+
+    args = parser.parse_args()
+
+    if not args.synonym_file and not args.synonym_store:
+        parser.error('provide a --synonym_file or --synonym_store')
+    gsnm.MAX_REQUESTS_PER_SECOND = args.max_rate
+    gsnm.GBIF_API_URL = args.api_url.rstrip('/') + '/'
+    if args.cache:
+        cache = ResponseCache(args.cache, ttl=args.cache_ttl * 24 * 3600,
+                              max_entries=args.cache_max_entries,
+                              refresh=args.refresh_cache)
+    else:
+        cache = None
+
+    print("Working on the requests and verification...")
+    try:
+        match_and_verify(args.inputfile, args.outputfile,
+                         synonym_file=args.synonym_file,
+                         synonym_store=args.synonym_store,
+                         outputcol=args.outputcol,
+                         api_terms=args.api_terms,
+                         update_cols=args.update,
+                         namecol=args.namecol,
+                         kingdomcol=args.kingdomcol,
+                         strict=args.strict,
+                         cache=cache,
+                         workers=args.workers,
+                         chunksize=args.chunksize)
+    finally:
+        if cache is not None:
+            cache.close()
+    print("".join(["saving to file ", args.outputfile, "...done!"]))
+
+if __name__ == "__main__":
+    sys.exit(main())
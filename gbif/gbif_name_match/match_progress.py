@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Progress and timing instrumentation of the GBIF name matching
+
+created within the scope of Lifewatch - INBO
+"""
+
+import sys
+import json
+import time
+import bisect
+import threading
+
+# upper bounds (milliseconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class MatchProgress(object):
+    """
+    Collect the progress of a name matching run: the rows and names
+    processed, the requests in flight, the request latency per endpoint
+    (match vs species/{key}), the number of retries, the cache hit ratio and
+    the estimated time to completion. The progress is reported as a progress
+    bar, as JSON log lines and/or to a callback function.
+
+    Example
+    -------
+    progress = MatchProgress(mode='json', interval=10)
+    extract_species_information('species-list.tsv', progress=progress)
+    progress.snapshot()
+    """
+
+    def __init__(self, mode="bar", interval=5., callback=None,
+                 stream=None):
+        """
+        Parameters
+        -----------
+        mode : 'bar' | 'json' | None
+            report as a progress bar, as a JSON line every interval seconds or
+            not at all (e.g. when only using the callback)
+        interval : float
+            seconds between two JSON lines or callback calls
+        callback : None | function
+            function called every interval seconds (and when done) with the
+            `snapshot` dictionary
+        stream : None | file
+            stream to write the progress bar or JSON lines to, sys.stderr
+            when None
+        """
+        if mode not in ("bar", "json", None):
+            raise Exception("Progress mode should be bar, json or None")
+        self.mode = mode
+        self.interval = interval
+        self.callback = callback
+        self.stream = stream
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self, rows_total=None, names_total=None):
+        """(re)start the collection of a matching run"""
+        with self._lock:
+            self.started = time.time()
+            self.rows_total = rows_total
+            self.rows_done = 0
+            self.names_total = names_total
+            self.names_done = 0
+            self.in_flight = 0
+            self.retries = 0
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.requests = {}
+            self._last_bar = 0.
+            self._last_report = 0.
+
+    def add_total(self, rows=0, names=0):
+        """increase the number of rows/names to process"""
+        with self._lock:
+            self.rows_total = (self.rows_total or 0) + rows
+            self.names_total = (self.names_total or 0) + names
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, endpoint, latency, retries=0):
+        """record a finished request to the endpoint (match or species)
+        taking latency seconds (including retries)
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.retries += retries
+            if endpoint not in self.requests:
+                self.requests[endpoint] = {
+                    "count": 0, "seconds": 0.,
+                    "histogram": [0] * (len(LATENCY_BUCKETS) + 1)}
+            stats = self.requests[endpoint]
+            stats["count"] += 1
+            stats["seconds"] += latency
+            stats["histogram"][bisect.bisect_left(LATENCY_BUCKETS,
+                                                  latency * 1000)] += 1
+        self.report()
+
+    def cache_lookup(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def names_matched(self, n_names=1):
+        with self._lock:
+            self.names_done += n_names
+        self.report()
+
+    def rows_processed(self, n_rows):
+        with self._lock:
+            self.rows_done += n_rows
+        self.report()
+
+    def _eta(self, elapsed):
+        """estimated seconds to completion, based on the names still to
+        match or, when unknown, the rows still to process
+        """
+        for done, total in [(self.names_done, self.names_total),
+                            (self.rows_done, self.rows_total)]:
+            if total and done:
+                return max(0., elapsed / done * (total - done))
+        return None
+
+    def snapshot(self):
+        """current state of the progress as a dictionary"""
+        with self._lock:
+            elapsed = time.time() - self.started
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "elapsed": round(elapsed, 3),
+                "rows_done": self.rows_done,
+                "rows_total": self.rows_total,
+                "names_done": self.names_done,
+                "names_total": self.names_total,
+                "names_per_second": round(self.names_done / elapsed, 2)
+                                    if elapsed else None,
+                "in_flight": self.in_flight,
+                "retries": self.retries,
+                "cache_hit_ratio": round(self.cache_hits / lookups, 4)
+                                   if lookups else None,
+                "eta": None if self._eta(elapsed) is None
+                       else round(self._eta(elapsed), 1),
+                "requests": {
+                    endpoint: {
+                        "count": stats["count"],
+                        "mean_latency": round(stats["seconds"] /
+                                              stats["count"], 4),
+                        "latency_histogram_ms": dict(zip(
+                            [str(bound) for bound in LATENCY_BUCKETS] +
+                            ["inf"], stats["histogram"]))}
+                    for endpoint, stats in self.requests.items()}}
+
+    def _bar(self, state, width=30):
+        total, done = state["names_total"], state["names_done"]
+        if not total:
+            total, done = state["rows_total"], state["rows_done"]
+        fraction = min(1., done / total) if total else 0.
+        eta = "?" if state["eta"] is None else \
+            time.strftime("%H:%M:%S", time.gmtime(state["eta"]))
+        hit_ratio = "-" if state["cache_hit_ratio"] is None else \
+            "{:.0%}".format(state["cache_hit_ratio"])
+        return "\r[{}{}] {:.0%} rows {}/{} names {}/{} in flight {} " \
+               "retries {} cache {} ETA {}".format(
+                   "#" * int(fraction * width),
+                   "." * (width - int(fraction * width)), fraction,
+                   state["rows_done"], state["rows_total"] or "?",
+                   state["names_done"], state["names_total"] or "?",
+                   state["in_flight"], state["retries"], hit_ratio, eta)
+
+    def report(self, force=False):
+        """report the progress, at most once every interval seconds (or
+        every 0.2 seconds for the progress bar) unless forced
+        """
+        now = time.time()
+        update_bar = self.mode == "bar" and (force or
+                                             now - self._last_bar >= 0.2)
+        update_report = force or now - self._last_report >= self.interval
+        if not (update_bar or update_report):
+            return
+        state = self.snapshot()
+        stream = self.stream or sys.stderr
+        if update_bar:
+            self._last_bar = now
+            stream.write(self._bar(state))
+            stream.flush()
+        if update_report:
+            self._last_report = now
+            if self.mode == "json":
+                stream.write(json.dumps(state) + "\n")
+                stream.flush()
+            if self.callback is not None:
+                self.callback(state)
+
+    def finish(self):
+        """report the final state"""
+        self.report(force=True)
+        if self.mode == "bar":
+            (self.stream or sys.stderr).write("\n")
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of GBIF API responses, stored in a SQLite file
+
+created within the scope of Lifewatch - INBO
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache(object):
+    """
+    Store the JSON responses of the GBIF API in a SQLite file, keyed on the
+    request URL (which contains all request parameters). Entries older than
+    the time to live are requested again and the least recently used entries
+    are removed when the cache grows beyond the maximum number of entries.
+
+    Example
+    -------
+    cache = ResponseCache('gbif_cache.sqlite', ttl=7 * 24 * 3600)
+    extract_species_information('species-list.tsv', cache=cache)
+    cache.close()
+    """
+
+    def __init__(self, filename, ttl=30 * 24 * 3600, max_entries=1000000,
+                 refresh=False):
+        """
+        Parameters
+        -----------
+        filename : str
+            path of the SQLite file, created when not existing
+        ttl : int | float | None
+            time to live of a cached response in seconds; None to keep
+            responses forever
+        max_entries : int | None
+            maximum number of responses in the cache; None for an unbounded
+            cache
+        refresh : boolean
+            if True, cached responses are ignored (but updated with the new
+            responses)
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(filename, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                        request TEXT PRIMARY KEY,
+                                        response TEXT NOT NULL,
+                                        created REAL NOT NULL,
+                                        accessed REAL NOT NULL)""")
+        self._connection.execute("""CREATE INDEX IF NOT EXISTS
+                                    responses_accessed
+                                    ON responses (accessed)""")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, request):
+        """return the cached response of the request URL or None when not
+        available or expired
+        """
+        if self.refresh:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE request = ?",
+                (request,)).fetchone()
+            if row is None or (self.ttl is not None and
+                               now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE request = ?",
+                (now, request))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, request, response):
+        """store the response of the request URL"""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (request, json.dumps(response), now, now))
+            self._connection.commit()
+
+    def evict(self):
+        """remove expired entries and the least recently used entries
+        exceeding the maximum number of entries
+        """
+        with self._lock:
+            if self.ttl is not None:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.ttl,))
+            if self.max_entries is not None:
+                self._connection.execute(
+                    """DELETE FROM responses WHERE request IN (
+                           SELECT request FROM responses
+                           ORDER BY accessed DESC LIMIT -1 OFFSET ?)""",
+                    (self.max_entries,))
+            self._connection.commit()
+
+    def close(self):
+        """apply the eviction policy and close the SQLite file"""
+        self.evict()
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed SQLite store of a synonym file, compiled once and used for the key
+lookups of repeated synonym verifications
+
+created within the scope of Lifewatch - INBO
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from verify_synonyms import (SYNONYM_COLUMNS, _read_table, _int_keys,
+                             _report_duplicates)
+
+
+def _source_signature(synonym_file):
+    """path, size and modification time of the synonym file, to detect a
+    changed synonym file
+    """
+    stat = os.stat(synonym_file)
+    return {"source": os.path.abspath(synonym_file),
+            "source_size": str(stat.st_size),
+            "source_mtime": str(stat.st_mtime_ns)}
+
+
+def build_synonym_store(synonym_file, store_file):
+    """compile the synonym file (tsv, Parquet or Feather) into an SQLite store
+    indexed on the usageKey and acceptedKey
+
+    Parameters
+    ----------
+    synonym_file : str
+        synonym file with the gbifapi_usageKey, gbifapi_acceptedKey and status
+        columns
+    store_file : str
+        SQLite file to write the store to (overwritten when existing)
+
+    Remarks
+    -------
+    Synonyms without an integer usageKey or acceptedKey can not be matched
+    and are not stored. Of duplicate key pairs, the first entry is kept.
+    """
+    synonyms = _read_table(synonym_file, SYNONYM_COLUMNS, delimiter='\t')
+    usage_keys = _int_keys(synonyms["gbifapi_usageKey"])
+    accepted_keys = _int_keys(synonyms["gbifapi_acceptedKey"])
+    valid = (usage_keys.notnull() & accepted_keys.notnull()).to_numpy()
+
+    # write to a temporary file, replacing the store when complete
+    store_tmp = store_file + '.tmp'
+    if os.path.exists(store_tmp):
+        os.remove(store_tmp)
+    connection = sqlite3.connect(store_tmp)
+    # the temporary file is discarded when interrupted, no journal required
+    connection.executescript("""
+        PRAGMA journal_mode = OFF;
+        PRAGMA synchronous = OFF;
+        CREATE TABLE synonyms (
+            usageKey INTEGER,
+            acceptedKey INTEGER,
+            status TEXT,
+            PRIMARY KEY (usageKey, acceptedKey)) WITHOUT ROWID;
+        CREATE TABLE source (
+            item TEXT PRIMARY KEY,
+            value TEXT);
+        """)
+    usage_keys = usage_keys[valid].to_numpy(dtype='int64')
+    accepted_keys = accepted_keys[valid].to_numpy(dtype='int64')
+    statuses = synonyms["status"][valid].astype(object)
+    statuses = statuses.where(statuses.notnull(), None).to_numpy()
+    _report_duplicates(usage_keys, accepted_keys, statuses)
+    # inserting in key order (stable, keeping the first of duplicate pairs)
+    # avoids random writes to the index
+    order = np.lexsort((accepted_keys, usage_keys))
+    connection.executemany(
+        "INSERT OR IGNORE INTO synonyms VALUES (?, ?, ?)",
+        zip(usage_keys[order].tolist(), accepted_keys[order].tolist(),
+            statuses[order].tolist()))
+    connection.executemany("INSERT INTO source VALUES (?, ?)",
+                           _source_signature(synonym_file).items())
+    connection.commit()
+    connection.close()
+    os.replace(store_tmp, store_file)
+
+
+class SynonymStore(object):
+    """
+    Look up the status of synonyms (usageKey and acceptedKey pairs) in the
+    SQLite store of a synonym file, as created by `build_synonym_store`.
+
+    Example
+    -------
+    store = SynonymStore('synonyms.sqlite', 'verified-synonyms.tsv')
+    store.statuses([17492], [17493])
+    """
+
+    def __init__(self, store_file, synonym_file=None):
+        """
+        Parameters
+        -----------
+        store_file : str
+            SQLite file with the synonym store
+        synonym_file : None | str
+            if provided, the store is (re)built from the synonym file when
+            the store does not exist or the synonym file changed since the
+            store was built
+        """
+        self.store_file = store_file
+        if synonym_file is not None and self._stale(synonym_file):
+            print("".join(["Building the synonym store ", store_file,
+                           " from ", synonym_file, "..."]))
+            build_synonym_store(synonym_file, store_file)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            "".join(["file:", store_file, "?mode=ro"]), uri=True,
+            check_same_thread=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """close the store file"""
+        self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT count(*) FROM synonyms").fetchone()[0]
+
+    def _stale(self, synonym_file):
+        """check if the store is missing or built from another (version of
+        the) synonym file
+        """
+        if not os.path.exists(self.store_file):
+            return True
+        connection = sqlite3.connect(
+            "".join(["file:", self.store_file, "?mode=ro"]), uri=True)
+        try:
+            source = dict(connection.execute("SELECT item, value FROM source"))
+        except sqlite3.DatabaseError:
+            return True
+        finally:
+            connection.close()
+        return source != _source_signature(synonym_file)
+
+    def statuses(self, usage_keys, accepted_keys):
+        """status of the synonym file for each of the usageKey and
+        acceptedKey pairs
+
+        Parameters
+        ----------
+        usage_keys, accepted_keys : iterable
+            usageKey and acceptedKey of each record (as text or integer)
+
+        Returns
+        -------
+        statuses : list
+            status of each pair, None when the pair is not in the store
+        """
+        # look up each distinct pair only once
+        codes, pairs = pd.factorize(pd.Series(list(zip(usage_keys,
+                                                       accepted_keys)),
+                                              dtype=object))
+        usage_keys = _int_keys([pair[0] for pair in pairs])
+        accepted_keys = _int_keys([pair[1] for pair in pairs])
+        valid = (usage_keys.notnull() & accepted_keys.notnull()).to_numpy()
+        lookup_pairs = list(zip(usage_keys[valid].astype('int64').tolist(),
+                                accepted_keys[valid].astype('int64').tolist()))
+        with self._lock:
+            # join the distinct pairs to the store in a single query
+            self._connection.executescript("""
+                CREATE TEMP TABLE IF NOT EXISTS lookup (
+                    usageKey INTEGER, acceptedKey INTEGER);
+                DELETE FROM temp.lookup;
+                """)
+            self._connection.executemany(
+                "INSERT INTO temp.lookup VALUES (?, ?)", lookup_pairs)
+            found = {(usage_key, accepted_key): status
+                     for usage_key, accepted_key, status in
+                     self._connection.execute("""
+                         SELECT lookup.usageKey, lookup.acceptedKey, status
+                         FROM temp.lookup JOIN synonyms
+                         ON lookup.usageKey = synonyms.usageKey
+                         AND lookup.acceptedKey = synonyms.acceptedKey""")}
+        pair_statuses = np.full(len(pairs), None, dtype=object)
+        pair_statuses[valid] = [found.get(pair) for pair in lookup_pairs]
+        return pair_statuses[codes].tolist()
+
+
+def main(argv=None):
+    """
+    Build the SQLite store of a synonym file
+    """
+    parser = argparse.ArgumentParser(description="""Compile a synonym file
+        into an indexed SQLite store, used by verify_synonyms.py (see
+        --synonym_store) to look up the synonyms without parsing the synonym
+        file on each verification.
+        """)
+
+    parser.add_argument('synonym_file', type=str,
+                        help='the relative path and filename of the synonym file (tsv, Parquet or Feather)')
+
+    parser.add_argument('store_file', type=str,
+                        help='the relative path and filename of the SQLite store file to create')
+
+    args = parser.parse_args()
+
+    print("Building the synonym store...")
+    build_synonym_store(args.synonym_file, args.store_file)
+    print("".join(["saving to file ", args.store_file, "...done!"]))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,336 @@
 
+import os
 import sys
+import glob
 import textwrap
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
 
-# Way to call script:
+# file extensions of the Parquet and Feather (Arrow IPC) file formats, other
+# files are handled as csv/tsv
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+FEATHER_EXTENSIONS = ('.feather', '.arrow', '.ipc')
+
+# columns of the synonym file (expected to be fixed)
+SYNONYM_COLUMNS = ["gbifapi_usageKey", "gbifapi_acceptedKey", "status"]
+
+# synonyms (DataFrame or SynonymStore) of a worker of verify_synonym_files
+_worker_synonyms = None
+
+
+def _file_format(filename):
+    """file format (csv, parquet or feather) based on the file extension"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    elif extension in FEATHER_EXTENSIONS:
+        return 'feather'
+    else:
+        return 'csv'
+
+
+def _read_table(filename, columns=None, delimiter=','):
+    """read a csv/tsv, Parquet or Feather file, optionally only the given
+    columns; csv/tsv files are read as text (dtype object)
+    """
+    file_format = _file_format(filename)
+    if file_format == 'parquet':
+        return pd.read_parquet(filename, columns=columns)
+    elif file_format == 'feather':
+        return pd.read_feather(filename, columns=columns)
+    else:
+        return pd.read_csv(filename, sep=delimiter, usecols=columns,
+                           encoding='utf-8', dtype=object)
+
+
+def _write_table(table, filename, delimiter=','):
+    """write to a csv/tsv (using delimiter), Parquet or Feather file, based
+    on the file extension; Parquet and Feather keep the column types
+    """
+    file_format = _file_format(filename)
+    if file_format == 'parquet':
+        table.to_parquet(filename, index=False)
+    elif file_format == 'feather':
+        table.reset_index(drop=True).to_feather(filename)
+    else:
+        table.to_csv(filename, sep=delimiter, index=False, encoding='utf-8')
+
+
+def _factorized_int_keys(keys):
+    """distinct GBIF keys (e.g. "123", "123.0" or 123) as nullable 64-bit
+    integers, converting each distinct key only once; missing and
+    non-integer keys become pd.NA
+
+    Returns
+    -------
+    codes : np.ndarray
+        position of each key in numbers, -1 for missing keys
+    numbers : pd.Series
+        distinct keys as Int64
+    """
+    codes, uniques = pd.factorize(pd.Series(keys).to_numpy(dtype=object))
+    numbers = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce')
+    numbers = numbers.where(numbers.notnull() & (numbers % 1 == 0) &
+                            (numbers.abs() < 2 ** 63)).astype('Int64')
+    return codes, numbers
+
+
+def _int_keys(keys):
+    """convert GBIF keys (e.g. "123", "123.0" or 123) into nullable 64-bit
+    integers; missing and non-integer keys become pd.NA
+    """
+    codes, numbers = _factorized_int_keys(keys)
+    return pd.Series(numbers.array.take(codes, allow_fill=True))
+
+
+def _key_positions(keys, index):
+    """position of each of the (integer) keys in the index, -1 when missing
+    or not in the index
+    """
+    codes, numbers = _factorized_int_keys(keys)
+    positions = np.full(len(numbers) + 1, -1, dtype='int64')
+    valid = numbers.notnull().to_numpy()
+    positions[:-1][valid] = index.get_indexer(
+        numbers[valid].to_numpy(dtype='int64'))
+    # codes of missing keys (-1) refer to the last position
+    return positions[codes]
+
+
+def _report_duplicates(usage_keys, accepted_keys, statuses):
+    """inform the user about duplicate key pairs in the synonym file, of
+    which only the first entry is used
+
+    Returns
+    -------
+    duplicates : pd.DataFrame
+        all entries of the duplicate key pairs, with the conflicting column
+        True when the entries of the key pair have different statuses
+    """
+    synonyms = pd.DataFrame({"gbifapi_usageKey": usage_keys,
+                             "gbifapi_acceptedKey": accepted_keys,
+                             "status": statuses})
+    keys = ["gbifapi_usageKey", "gbifapi_acceptedKey"]
+    duplicates = synonyms[synonyms.duplicated(keys, keep=False)].copy()
+    duplicates["conflicting"] = duplicates.groupby(keys)["status"].transform(
+        lambda status: status.nunique(dropna=False) > 1)
+    if len(duplicates):
+        n_pairs = len(duplicates.drop_duplicates(keys))
+        n_conflicting = len(duplicates[duplicates["conflicting"]]
+                            .drop_duplicates(keys))
+        print("".join(["Found ", str(len(duplicates)), " synonym entries for ",
+                       str(n_pairs), " duplicate key pairs (",
+                       str(n_conflicting), " with conflicting statuses); ",
+                       "the first entry of each key pair is used."]))
+        for _, entry in duplicates[duplicates["conflicting"]].head(10) \
+                .iterrows():
+            print("".join(["  ", str(entry["gbifapi_usageKey"]), " / ",
+                           str(entry["gbifapi_acceptedKey"]), ": ",
+                           str(entry["status"])]))
+    return duplicates
+
+
+class SynonymList(object):
+    """
+    Look up the status of synonyms (usageKey and acceptedKey pairs) in a
+    synonym file loaded in memory. The keys are converted to 64-bit integers
+    and each key pair to a single integer (the position of the usageKey
+    and acceptedKey in the distinct keys of the synonym file), looked up in
+    a hash table. Of duplicate key pairs, the first entry is used (see
+    `duplicates`).
+
+    Example
+    -------
+    synonyms = SynonymList('verified-synonyms.tsv')
+    synonyms.statuses(["17492"], ["17493.0"])
+    """
+
+    def __init__(self, synonym_file):
+        """
+        Parameters
+        -----------
+        synonym_file : str
+            synonym file with the gbifapi_usageKey, gbifapi_acceptedKey and
+            status columns (tsv, Parquet or Feather)
+        """
+        synonyms = _read_table(synonym_file, SYNONYM_COLUMNS, delimiter='\t')
+        usage_keys = _int_keys(synonyms["gbifapi_usageKey"])
+        accepted_keys = _int_keys(synonyms["gbifapi_acceptedKey"])
+        # synonyms without an integer key can not be matched
+        valid = (usage_keys.notnull() & accepted_keys.notnull()).to_numpy()
+        usage_keys = usage_keys[valid].to_numpy(dtype='int64')
+        accepted_keys = accepted_keys[valid].to_numpy(dtype='int64')
+        statuses = synonyms["status"].astype(object)[valid]
+        statuses = statuses.where(statuses.notnull(), None).to_numpy()
+
+        self.duplicates = _report_duplicates(usage_keys, accepted_keys,
+                                             statuses)
+        self._usage_keys = pd.Index(np.unique(usage_keys))
+        self._accepted_keys = pd.Index(np.unique(accepted_keys))
+        pairs = pd.Index(self._pair_codes(
+            self._usage_keys.get_indexer(usage_keys),
+            self._accepted_keys.get_indexer(accepted_keys)))
+        first = ~pairs.duplicated(keep='first')
+        self._pairs = pairs[first]
+        self._statuses = statuses[first]
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def _pair_codes(self, usage_positions, accepted_positions):
+        """single integer for each pair of key positions"""
+        return usage_positions * len(self._accepted_keys) + accepted_positions
+
+    def close(self):
+        """for compatibility with SynonymStore; nothing to close"""
+        pass
+
+    def statuses(self, usage_keys, accepted_keys):
+        """status of the synonym file for each of the usageKey and
+        acceptedKey pairs (as text or integer), None when the pair is not in
+        the synonym file
+        """
+        usage_positions = _key_positions(usage_keys, self._usage_keys)
+        accepted_positions = _key_positions(accepted_keys,
+                                            self._accepted_keys)
+        positions = np.full(len(usage_positions), -1, dtype='int64')
+        known = (usage_positions >= 0) & (accepted_positions >= 0)
+        positions[known] = self._pairs.get_indexer(self._pair_codes(
+            usage_positions[known], accepted_positions[known]))
+        statuses = np.full(len(positions), None, dtype=object)
+        found = positions >= 0
+        statuses[found] = self._statuses[positions[found]]
+        return statuses
+
+
+def _add_verification(verified, status, taxonomicstatuscol, outputcol):
+    """add the status of the synonym file as outputcol or, when outputcol
+    is already present, overwrite it for the SYNONYM records
+    """
+    status = pd.Series(status, index=verified.index, dtype=object)
+    # overwrite for SYNONYM values when already present
+    if outputcol in verified.columns:
+        synonyms = verified[taxonomicstatuscol] == "SYNONYM"
+        verified.loc[synonyms, outputcol] = status[synonyms]
+    else:
+        verified[outputcol] = status
+    return verified
+
+
+def _verification_counts(verified, taxonomicstatuscol, outputcol):
+    """number of rows, SYNONYM rows and SYNONYM rows for each verification
+    status (unverified when not in the synonym file); only the number of rows
+    without a taxonomicstatuscol
+    """
+    if taxonomicstatuscol not in verified.columns:
+        return {'rows': len(verified)}
+    synonyms = (verified[taxonomicstatuscol] == "SYNONYM").to_numpy()
+    status = verified[outputcol][synonyms]
+    counts = {'rows': len(verified), 'synonyms': int(synonyms.sum()),
+              'unverified': int(status.isnull().sum())}
+    counts.update({str(value): int(count) for value, count
+                   in status.value_counts().items()})
+    return counts
+
+
+def _add_counts(counts, other):
+    for item, count in other.items():
+        counts[item] = counts.get(item, 0) + count
+    return counts
+
+
+def _read_input(input_file):
+    """read the input file (csv, tsv, parquet or feather) and define the
+    delimiter of the output file
+    """
+    if isinstance(input_file, str):
+        if input_file.endswith('tsv'):
+            delimiter = '\t'
+        else:
+            delimiter = ','
+        return _read_table(input_file, delimiter=delimiter), delimiter
+    elif isinstance(input_file, pd.DataFrame):
+        delimiter = ',' # Patch: set a delimiter for the output file
+        # the verification is added to a copy of the input DataFrame
+        return input_file.copy(), delimiter
+    else:
+        raise Exception('Input datatype not supported, use either str or a \
+                            pandas DataFrame')
+
+
+def _verify_table(table, synonyms, usagekeycol, acceptedkeycol,
+                  taxonomicstatuscol, outputcol):
+    """add the verification of the synonyms to the table, looking up the
+    keys in the synonyms (SynonymList or SynonymStore); the number of rows
+    is kept
+    """
+    status = synonyms.statuses(table[usagekeycol], table[acceptedkeycol])
+    return _add_verification(table, status, taxonomicstatuscol, outputcol)
+
+
+def _verify_synonym_chunked(input_file, output_file, synonyms, chunksize,
+                            *columns):
+    """read, verify and write the input file in chunks of chunksize rows,
+    keeping only the synonyms and a single chunk in memory, see
+    `verify_synonym`
+
+    The output is written to a temporary file next to the output file, which
+    replaces the output file when all chunks are done (enabling the output
+    file to be the same as the input file).
+
+    Returns
+    -------
+    counts : dict
+        number of rows, SYNONYM rows and verified SYNONYM rows by status
+    """
+    if not isinstance(input_file, str) or not isinstance(output_file, str):
+        raise Exception('Processing in chunks requires a filename for both \
+                            the input and the output')
+    if _file_format(input_file) != 'csv' or _file_format(output_file) != 'csv':
+        raise Exception('Processing in chunks is only supported for csv/tsv \
+                            files')
+
+    if input_file.endswith('tsv'):
+        delimiter = '\t'
+    else:
+        delimiter = ','
+    output_tmp = output_file + '.tmp'
+    reader = pd.read_csv(input_file, sep=delimiter, encoding='utf-8',
+                         dtype=object, chunksize=chunksize)
+    n_rows = 0
+    counts = {}
+    try:
+        for chunk in reader:
+            verified = _verify_table(chunk, synonyms, *columns)
+            _add_counts(counts, _verification_counts(verified, *columns[2:]))
+            verified.to_csv(output_tmp, sep=delimiter, index=False,
+                            encoding='utf-8', mode='w' if n_rows == 0 else 'a',
+                            header=n_rows == 0)
+            n_rows += len(chunk)
+            print(''.join(['Verified ', str(n_rows), ' rows.']))
+    finally:
+        reader.close()
+    if n_rows == 0:
+        # without any rows, only the header is written
+        verified = _verify_table(pd.read_csv(input_file, sep=delimiter,
+                                             nrows=0, dtype=object),
+                                 synonyms, *columns)
+        verified.to_csv(output_tmp, sep=delimiter, index=False,
+                        encoding='utf-8')
+        counts = _verification_counts(verified, *columns[2:])
+    os.replace(output_tmp, output_file)
+    return counts
+
 
 def verify_synonym(input_file, output_file, synonym_file,
                    usagekeycol='gbifapi_usageKey', 
                    acceptedkeycol='gbifapi_acceptedKey', 
                    taxonomicstatuscol='gbifapi_status',
-                   outputcol='nameMatchValidation'):
+                   outputcol='nameMatchValidation',
+                   synonym_store=None,
+                   chunksize=None):
     """verify if more information on the synonyms is already present
     Find out which of the synonyms were already registered as defined by the 
     synonym_file, by checking the match between the usageKey AND acceptedKey
@@ -21,11 +340,15 @@ def verify_synonym(input_file, output_file, synonym_file,
     Parameters:
     --------
     input_file: str (filepath) | pd.DataFrame
-        input file to check the synonym values or pandas Dataframe
+        input file to check the synonym values or pandas Dataframe; csv/tsv,
+        Parquet (.parquet) and Feather/Arrow IPC (.feather, .arrow) files are
+        supported, based on the file extension
     output_file: str (filepath) | None
-        output file to write result, if None, no output file will be created
+        output file to write result, if None, no output file will be created;
+        the file format is based on the file extension
     synonym_file: str
-        relatie path to the synonym file for the verification
+        relatie path to the synonym file for the verification (tsv, Parquet
+        or Feather file)
     usagekeycol: str (default: gbifapi_usageKey)
         column name with the usagekey for input_file 
     acceptedkeycol: str (default: gbifapi_acceptedKey)
@@ -34,57 +357,201 @@ def verify_synonym(input_file, output_file, synonym_file,
         column name with the API status of GBIF for input_file, NOT  status
     outputcol: str
         column name to put the remarks of the verification of the input file
+    synonym_store: str (filepath) | None
+        if provided, the synonyms are looked up in this SQLite store instead
+        of read from the synonym_file; the store is (re)built from the
+        synonym_file when it does not exist or the synonym_file changed
+        since (synonym_file can be None to use an existing store as is)
+    chunksize: int | None
+        if provided, the input file is read, verified and written to the
+        output file in chunks of chunksize rows, keeping only the synonyms
+        and a single chunk in memory (requires a csv/tsv filename for both
+        input_file and output_file); nothing is returned
         
     Remarks:
     --------
     For the synonym_file, the names of the usagekey, acceptedkey and status
     columns are fixed and should be equal to respectively `gbifapi_usageKey`,  
-    `gbifapi_acceptedKey` and 'status'
+    `gbifapi_acceptedKey` and 'status'. The keys are compared as 64-bit
+    integers (e.g. "123" and "123.0" match). Of duplicate key pairs in the
+    synonym_file, only the first entry is used (and reported), so the output
+    has the same number of rows as the input.
     """
     
     if taxonomicstatuscol == "status":
         raise Exception('Change name of the status column of your input file')
     
-    if isinstance(input_file, str):
-        # Reading in the files (csv or tsv)
-        if input_file.endswith('tsv'):
-            delimiter = '\t'
-        else:
-            delimiter = ','
-        input_file = pd.read_csv(input_file, sep=delimiter, 
-                                encoding='utf-8', dtype=object)  
-    elif isinstance(input_file, pd.DataFrame):
-        delimiter = ',' # Patch: set a delimiter for the output file
-        input_file = input_file.copy()
+    if synonym_store:
+        from synonym_store import SynonymStore
+        synonyms = SynonymStore(synonym_store, synonym_file)
     else:
-        raise Exception('Input datatype not supported, use either str or a \
-                            pandas DataFrame')
-    
-    # read the synonyms file    
-    synonyms = pd.read_csv(synonym_file, sep='\t', dtype=object)
-    
-    #extract useful columns from synonym file (expected to be fixed)
-    synonyms_subset = synonyms[["gbifapi_usageKey", "gbifapi_acceptedKey", "status"]]
-    
-    # Check the matches by doing a join of the inputfile with the synonym
-    verified = pd.merge(input_file, synonyms_subset, how='left',
-                        left_on=[usagekeycol, acceptedkeycol], 
-                        right_on=["gbifapi_usageKey", "gbifapi_acceptedKey"])
-    
-    # overwrite for SYNONYM values when already present
-    if outputcol in verified.columns:
-        verified.loc[verified[taxonomicstatuscol] == "SYNONYM", outputcol] = \
-            verified.loc[verified[taxonomicstatuscol] == "SYNONYM", 'status']
-        verified = verified.drop('status', axis=1)
-    else:
-        verified = verified.rename(columns={'status' : outputcol})
-        
+        synonyms = SynonymList(synonym_file)
+    columns = (usagekeycol, acceptedkeycol, taxonomicstatuscol, outputcol)
+
+    try:
+        if chunksize:
+            _verify_synonym_chunked(input_file, output_file, synonyms,
+                                    chunksize, *columns)
+            return None
+
+        input_file, delimiter = _read_input(input_file)
+
+        verified = _verify_table(input_file, synonyms, *columns)
+    finally:
+        if synonym_store:
+            synonyms.close()
+
     if (output_file != None) & isinstance(output_file, str):
-        verified.to_csv(output_file, sep=delimiter, index=False, 
-                            encoding='utf-8')
+        _write_table(verified, output_file, delimiter)
     return verified
 
 
+def _init_worker(synonyms):
+    """load the synonyms of a worker: the DataFrame of the synonym file or
+    the filename of the synonym store
+    """
+    global _worker_synonyms
+    if isinstance(synonyms, str):
+        from synonym_store import SynonymStore
+        synonyms = SynonymStore(synonyms)
+    _worker_synonyms = synonyms
+
+
+def _verify_file(input_file, output_file, chunksize, columns):
+    """verify a single file with the synonyms of the worker"""
+    if chunksize:
+        counts = _verify_synonym_chunked(input_file, output_file,
+                                         _worker_synonyms, chunksize, *columns)
+    else:
+        table, delimiter = _read_input(input_file)
+        verified = _verify_table(table, _worker_synonyms, *columns)
+        _write_table(verified, output_file, delimiter)
+        counts = _verification_counts(verified, *columns[2:])
+    print("".join(["Verified ", input_file, " to ", output_file, "."]))
+    return counts
+
+
+def _is_pattern(filename):
+    """check if the filename is a glob pattern"""
+    return any(char in filename for char in '*?[')
+
+
+def _input_files(input_files):
+    """list of input files, expanding the glob patterns"""
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    filenames = []
+    for pattern in input_files:
+        if _is_pattern(pattern):
+            filenames += sorted(glob.glob(pattern))
+        else:
+            filenames.append(pattern)
+    if not filenames:
+        raise Exception("".join(["No input files found for ",
+                                 ", ".join(input_files)]))
+    return filenames
+
+
+def _output_files(input_files, output):
+    """output file of each input file: output is a list of filenames, a
+    pattern with {name} (the input filename without extension) or a
+    directory
+    """
+    if not isinstance(output, str):
+        output_files = list(output)
+    elif '{name}' in output:
+        output_files = [output.replace('{name}', os.path.splitext(
+                            os.path.basename(filename))[0])
+                        for filename in input_files]
+    elif os.path.isdir(output):
+        output_files = [os.path.join(output, os.path.basename(filename))
+                        for filename in input_files]
+    else:
+        raise Exception('Provide the output as a directory, as a pattern \
+                            containing {name} or as a list of filenames')
+    if len(output_files) != len(input_files) or \
+            len(set(output_files)) != len(output_files):
+        raise Exception('Provide a distinct output file for each input file')
+    return output_files
+
+
+def verify_synonym_files(input_files, output, synonym_file,
+                         usagekeycol='gbifapi_usageKey',
+                         acceptedkeycol='gbifapi_acceptedKey',
+                         taxonomicstatuscol='gbifapi_status',
+                         outputcol='nameMatchValidation',
+                         synonym_store=None,
+                         chunksize=None,
+                         processes=None):
+    """verify the synonyms of multiple files against the same synonym file,
+    loading the synonyms only once and verifying the files in parallel
+
+    Parameters:
+    --------
+    input_files: str | list of str
+        input files or glob patterns, e.g. 'enriched/*.csv'
+    output: str | list of str
+        output file for each input file, as a list, a pattern with {name}
+        being replaced by the input filename without extension (e.g.
+        'verified/{name}.csv') or a directory (keeping the input filenames)
+    processes: int | None
+        number of files verified in parallel (in separate processes); if
+        None, the number of CPUs
+    synonym_file, usagekeycol, acceptedkeycol, taxonomicstatuscol,
+    outputcol, synonym_store, chunksize:
+        see `verify_synonym`
+
+    Returns:
+    --------
+    summary: pd.DataFrame
+        for each input file (and in total) the output file and the number of
+        rows, SYNONYM rows, SYNONYM rows not in the synonym file (unverified)
+        and SYNONYM rows for each status of the synonym file
+    """
+    if taxonomicstatuscol == "status":
+        raise Exception('Change name of the status column of your input file')
+
+    input_files = _input_files(input_files)
+    output_files = _output_files(input_files, output)
+    columns = (usagekeycol, acceptedkeycol, taxonomicstatuscol, outputcol)
+
+    # load the synonyms once; the workers get the DataFrame when started or
+    # open the (up to date) store themselves
+    if synonym_store:
+        from synonym_store import SynonymStore
+        SynonymStore(synonym_store, synonym_file).close()
+        synonyms = synonym_store
+    else:
+        synonyms = SynonymList(synonym_file)
+
+    processes = min(processes or os.cpu_count() or 1, len(input_files))
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_init_worker,
+                                 initargs=(synonyms,)) as executor:
+            counts = list(executor.map(_verify_file, input_files,
+                                       output_files,
+                                       [chunksize] * len(input_files),
+                                       [columns] * len(input_files)))
+    else:
+        _init_worker(synonyms)
+        try:
+            counts = [_verify_file(input_file, output_file, chunksize,
+                                   columns)
+                      for input_file, output_file
+                      in zip(input_files, output_files)]
+        finally:
+            if synonym_store:
+                _worker_synonyms.close()
+
+    summary = pd.DataFrame(counts, index=pd.Index(input_files,
+                                                  name='input_file'))
+    summary = summary.fillna(0).astype('int64')
+    summary.loc['total'] = summary.sum()
+    summary.insert(0, 'output_file', output_files + [''])
+    return summary
+
+
 def main(argv=None):
     """
     Use usagekeycol and acceptedkeycol to lookup a match in the synonymlist
@@ -102,16 +569,28 @@ def main(argv=None):
         provided of a verify status. If no match is found, nothing is done.
         """)    
     
-    parser.add_argument('input_file', type=str,
-                        help='the relative path and filename containing the usage and acceptedkey col')
+    parser.add_argument('input_file', type=str, nargs='+',
+                        help='the relative path and filename containing the usage and acceptedkey col; multiple files or glob patterns (e.g. "enriched/*.csv") are verified in parallel')
                        
     parser.add_argument('output_file', action='store', default=None, 
-                        help='output file name, can be same as input')              
+                        help='output file name, can be same as input; for multiple input files, a directory or a pattern with {name} for the input filename without extension (e.g. "verified/{name}.csv")')              
     
     parser.add_argument('--synonym_file', type=str,
                         action='store', default=None, 
                         help='relative path and filename to the file containing the synonym status information')                                            
 
+    parser.add_argument('--synonym_store', type=str,
+                        action='store', default=None, 
+                        help='SQLite file with the indexed store of the synonym file, (re)built from the synonym file when missing or when the synonym file changed, to look up the synonyms without parsing the synonym file (default when not provided: None)')                                            
+
+    parser.add_argument('--chunksize', type=int,
+                        action='store', default=None, 
+                        help='number of rows to read, verify and write at once, keeping the memory use constant for large csv/tsv files; if None, the entire file is handled at once (default when not provided: None)')                                            
+
+    parser.add_argument('--processes', type=int,
+                        action='store', default=None, 
+                        help='number of input files verified in parallel; if None, the number of CPUs (default when not provided: None)')                                            
+
     parser.add_argument('--usagekeycol', type=str,
                         action='store', default='gbifapi_usageKey', 
                         help='column name of the input file containing the gbif usage keys (default when not provided: `gbifapi_usageKey`)')                                            
@@ -134,7 +613,7 @@ def main(argv=None):
     print(textwrap.dedent("""\
                           Using {} as input file and searching matches
                           with the synonmys enlisted in {}
-                          """.format(args.input_file, 
+                          """.format(", ".join(args.input_file), 
                                      args.synonym_file)))
     print(textwrap.dedent("""\
                           Columns of usage_key and accepted_key as provided by
@@ -147,12 +626,28 @@ def main(argv=None):
     print(textwrap.dedent("""\
                           Writing verification information to column {}
                           """.format(args.outputcol)))
-    verify_synonym(args.input_file, args.output_file,
+    if len(args.input_file) > 1 or _is_pattern(args.input_file[0]):
+        summary = verify_synonym_files(args.input_file, args.output_file,
+                                       args.synonym_file,
+                                       args.usagekeycol,
+                                       args.acceptedkeycol,
+                                       args.taxonomicstatuscol,
+                                       args.outputcol,
+                                       args.synonym_store,
+                                       args.chunksize,
+                                       args.processes)
+        print(summary.to_string())
+        print("".join(["saving to files ", args.output_file, "...done!"]))
+        return
+
+    verify_synonym(args.input_file[0], args.output_file,
                    args.synonym_file,
                    args.usagekeycol,
                    args.acceptedkeycol,
                    args.taxonomicstatuscol,
-                   args.outputcol
+                   args.outputcol,
+                   args.synonym_store,
+                   args.chunksize
                    ) 
     print("".join(["saving to file", args.output_file, "...done!"]))
 